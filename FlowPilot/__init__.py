@@ -1,5 +1,15 @@
 from .flowpilot import FlowPilot
 from .import_extractor import ImportExtractor
 from .category import CategoryRegister
-from .pipes import Pipeline
+from .pipes import Pipeline, DAGPipeline, PipelineGroup
 from .project import Project
+from .cache import StepCache
+from .profiling import RunReport, JsonLinesHook
+from .registry_index import RegistryIndex, LazyFunction
+from .columnar import ColumnarStore, ColumnarRef
+from .fusion import FusedStep
+from .compiler import PipelineCompiler
+from .memory import MemoryBudget, SpilledRef
+from .testing import TestRunner
+from .pushdown import PushdownPlanner, RowPredicate
+from .distributed import DistributedExecutor
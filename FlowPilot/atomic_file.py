@@ -0,0 +1,28 @@
+import os
+import uuid
+import shutil
+
+
+def write_atomically(path: str, content: str) -> None:
+    """Write a text file so that readers see either its previous or its new content, never a partial one.
+
+    The content is written to a temporary file next to it, which then replaces it. The file gets the
+    permissions of the file it replaces or, for a new file, those allowed by the umask, as with open().
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    # Unlike tempfile.mkstemp, which creates files readable by their owner only, os.open applies the umask
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,262 @@
+import os
+import shutil
+import hashlib
+import pickle
+import types
+import tempfile
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+from function_source import *
+from columnar import *
+from registry_index import *
+
+
+class StepCache:
+    """Content-addressed cache of pipeline step results.
+
+    Results are keyed on the step function's source, its args and kwargs and a fingerprint of
+    its input. Entries live in an in-memory LRU tier and, when a directory is given, in an
+    on-disk tier. Both tiers evict their least recently used entries once over their size budget.
+
+    With columnar=True, DataFrames are stored on disk only, in a ColumnarStore, and are
+    memory-mapped instead of unpickled when they are read back.
+
+    With durable=True, disk entries are flushed to the storage device before they are
+    considered written, so that they survive a crash of the machine.
+
+    With write_through=False, entries are only written to disk when the memory tier evicts
+    them, or when they are too large for it. Entries still in memory are lost when the
+    process exits.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_memory_bytes: int = 256 * 1024 ** 2,
+                 max_disk_bytes: int = 2 * 1024 ** 3, columnar: bool = False, durable: bool = False,
+                 write_through: bool = True):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.durable = durable
+        self.write_through = write_through
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self.columnar_store: Optional[ColumnarStore] = None
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            if columnar:
+                self.columnar_store = ColumnarStore(os.path.join(self.directory, "columnar"))
+
+    @staticmethod
+    def fingerprint(value: Any) -> Optional[str]:
+        """Return a content hash of a value, or None if it cannot be fingerprinted."""
+        digest = hashlib.sha256()
+        try:
+            import pandas as pd
+        except ImportError:
+            pd = None
+
+        try:
+            if pd is not None and isinstance(value, (pd.DataFrame, pd.Series)):
+                frame = value.to_frame() if isinstance(value, pd.Series) else value
+                digest.update(type(value).__name__.encode())
+                digest.update(pickle.dumps(list(frame.columns)))
+                digest.update(str(list(frame.dtypes)).encode())
+                digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+            else:
+                digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return None
+        return digest.hexdigest()
+
+    @staticmethod
+    def function_source(func: Callable) -> str:
+        """Return the source of a function, falling back to its bytecode when no source is available."""
+        if isinstance(func, LazyFunction):
+            # The source saved in the registry index may be older than the code the step runs
+            func = func.load()
+        try:
+            return FunctionSource.get_source(func)
+        except (OSError, TypeError):
+            code = getattr(func, "__code__", None)
+            return repr(code.co_code) if code is not None else repr(func)
+
+    @staticmethod
+    def code_fingerprint(func: Callable) -> str:
+        """Hash the bytecode, names and constants of a function, empty for callables without a code object.
+
+        Unlike the source, which is read from the file as it is now, these identify the code the process runs.
+        """
+        if isinstance(func, LazyFunction):
+            func = func.load()
+        code = getattr(func, "__code__", None)
+        if code is None:
+            return ""
+        digest = hashlib.sha256()
+        pending = [code]
+        while pending:
+            code = pending.pop()
+            digest.update(code.co_code)
+            digest.update(repr(code.co_names).encode())
+            for constant in code.co_consts:
+                if isinstance(constant, types.CodeType):
+                    pending.append(constant)
+                elif isinstance(constant, frozenset):
+                    # The order of a set depends on the hash seed of the process
+                    digest.update(repr(sorted(repr(item) for item in constant)).encode())
+                else:
+                    digest.update(repr(constant).encode())
+        return digest.hexdigest()
+
+    def make_key(self, func: Callable, inputs: List[Any], args: tuple, kwargs: Dict[str, Any]) -> Optional[str]:
+        """Return the cache key of a step call, or None if the call cannot be cached."""
+        parts = [f"{func.__module__}.{func.__qualname__}", self.function_source(func), self.code_fingerprint(func)]
+        for value in [*inputs, args, kwargs]:
+            fingerprint = self.fingerprint(value)
+            if fingerprint is None:
+                return None
+            parts.append(fingerprint)
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (True, value) for a cached key, promoting disk entries to memory, else (False, None)."""
+        if self.columnar_store is not None and self.columnar_store.contains(key):
+            self.hits += 1
+            os.utime(self.columnar_store.path(key))
+            return True, self.columnar_store.read(key)
+
+        payload = self._memory.get(key)
+        if payload is not None:
+            self._memory.move_to_end(key)
+        else:
+            payload = self._read_from_disk(key)
+            if payload is not None:
+                self._store_in_memory(key, payload)
+
+        if payload is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, pickle.loads(payload)
+
+    def contains(self, key: str) -> bool:
+        """Check whether a key is cached, without loading its value or counting a hit or miss."""
+        if self.columnar_store is not None and self.columnar_store.contains(key):
+            return True
+        return key in self._memory or (self.directory is not None and os.path.exists(self._disk_path(key)))
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value in both tiers. Values which cannot be pickled are not cached."""
+        if self.columnar_store is not None and ColumnarStore.supports(value):
+            self.columnar_store.write(key, value)
+            self._evict_disk()
+            return
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        stored = self._store_in_memory(key, payload)
+        if self.write_through or not stored:
+            self._write_to_disk(key, payload)
+
+    def delete(self, key: str) -> None:
+        """Remove an entry from both tiers."""
+        payload = self._memory.pop(key, None)
+        if payload is not None:
+            self._memory_bytes -= len(payload)
+        if self.columnar_store is not None:
+            self.columnar_store.delete(key)
+        if self.directory is not None and os.path.exists(self._disk_path(key)):
+            self._remove_disk_entry(self._disk_path(key))
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers."""
+        self._memory.clear()
+        self._memory_bytes = 0
+        for path, _, _ in self._disk_entries():
+            self._remove_disk_entry(path)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss counters and the size of each tier."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": sum(size for _, size, _ in self._disk_entries()),
+        }
+
+    def _store_in_memory(self, key: str, payload: bytes) -> bool:
+        """Store an entry in the memory tier, evicting the least recently used ones. Returns whether it was stored."""
+        if len(payload) > self.max_memory_bytes:
+            return False
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = payload
+        self._memory_bytes += len(payload)
+        while self._memory_bytes > self.max_memory_bytes:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            if not self.write_through and self.directory is not None and not os.path.exists(self._disk_path(evicted_key)):
+                # Keys are content-addressed, so an entry already on disk holds the same value
+                self._write_to_disk(evicted_key, evicted)
+        return True
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _disk_entries(self) -> List[Tuple[str, int, float]]:
+        if self.directory is None:
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        if self.columnar_store is not None:
+            for key in self.columnar_store.keys():
+                path = self.columnar_store.path(key)
+                entries.append((path, self.columnar_store.size(key), os.stat(path).st_mtime))
+        return entries
+
+    @staticmethod
+    def _remove_disk_entry(path: str) -> None:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+    def _read_from_disk(self, key: str) -> Optional[bytes]:
+        if self.directory is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+        except OSError:
+            return None
+        # Touch the entry so that eviction removes the least recently used files first
+        os.utime(path)
+        return payload
+
+    def _write_to_disk(self, key: str, payload: bytes) -> None:
+        if self.directory is None or len(payload) > self.max_disk_bytes:
+            return
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            if self.durable:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, self._disk_path(key))
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes:
+                break
+            self._remove_disk_entry(path)
+            total -= size
@@ -2,18 +2,53 @@ import os
 import re
 import inspect
 import json
-from typing import Callable, Dict, List, Optional, Union, Any
+import pkgutil
+import hashlib
+import threading
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from types import ModuleType
+from typing import Callable, Dict, List, Optional, Tuple, Union, Any
 from functools import wraps
-import textwrap
+
+from import_extractor import *
+from function_source import *
+from search_index import *
+from registry_index import *
+from atomic_file import *
 
 
 class CategoryRegister:
-    def __init__(self, categories: List[str]):
+    # Options which can be given when registering a function, read by Pipeline when running the step:
+    #   combine: marks the step as a reducer. In streaming mode the function is applied to each chunk
+    #            and `combine` receives the list of per-chunk results to produce the final output.
+    #   fuse:    "filter" for a transformer returning a boolean row mask of its input, or "assign" for one
+    #            returning a dict of new columns. Consecutive fusable steps can run as a single pass.
+    #   partitions: number of row partitions of its input DataFrame a step is run on, across a process pool,
+    #            by Pipeline.execute. The results are concatenated in order, or given to `combine`.
+    #   retries: number of times a step failing with one of the `retry_on` exceptions (default: OSError, which
+    #            includes TimeoutError) is retried, after `retry_delay` seconds (default 1) multiplied by
+    #            `backoff` (default 2) after every attempt.
+    #   timeout: seconds after which an attempt of the step fails with a TimeoutError.
+    #   columns: the columns of its input DataFrame a step reads, used to push a projection down to the reader.
+    #   pushdown: marks a reader accepting `columns` and `predicate` keyword arguments, given by Pipeline
+    #            from the columns and the leading `fuse="filter"` steps of the pipeline.
+    STEP_OPTIONS = ["combine", "fuse", "partitions", "retries", "retry_delay", "backoff", "retry_on", "timeout",
+                    "columns", "pushdown"]
+
+    # Hashes of the exported category files, written next to them
+    EXPORT_MANIFEST = ".flowpilot_export.json"
+
+    def __init__(self, categories: List[str], namespace: Optional[str] = None):
         self.categories = categories
+        # Functions registered in a namespace are stored as "<namespace>.<function name>", so that
+        # registers of different teams can be merged without their functions overwriting each other
+        self.namespace = namespace
         
         self.functions: Dict[str, Dict[str, Optional[Callable]]] = {
             category: {} for category in categories
         }
+        self.search_index = SearchIndex()
 
     def is_valid_category(self, category_name: str) -> bool:
         """Check if the given category name is valid."""
@@ -28,19 +63,164 @@ class CategoryRegister:
             
 
     
-    def register_function(self, category: str, comment: Optional[str] = None) -> Callable[..., Any]:
-        """Register a function in the specified category."""
+    def qualify(self, func_name: str) -> str:
+        """Return the name a function is registered under in this register's namespace."""
+        return f"{self.namespace}.{func_name}" if self.namespace else func_name
+
+    def _validate_step_options(self, step_options: Dict[str, Any]) -> None:
+        for option in step_options:
+            if option not in self.STEP_OPTIONS:
+                raise ValueError(f"Invalid step option '{option}'. It should be one of {self.STEP_OPTIONS}.")
+        if step_options.get("fuse") not in [None, "filter", "assign"]:
+            raise ValueError("Invalid fuse option. It should be one of 'filter' or 'assign'.")
+        partitions = step_options.get("partitions")
+        if partitions is not None and (not isinstance(partitions, int) or partitions < 1):
+            raise ValueError("Invalid partitions option. It should be a positive integer.")
+        retries = step_options.get("retries")
+        if retries is not None and (not isinstance(retries, int) or retries < 0):
+            raise ValueError("Invalid retries option. It should be a non-negative integer.")
+        retry_on = step_options.get("retry_on")
+        if retry_on is not None:
+            if not isinstance(retry_on, tuple):
+                retry_on = step_options["retry_on"] = (retry_on,)
+            if not all(isinstance(error, type) and issubclass(error, BaseException) for error in retry_on):
+                raise ValueError("Invalid retry_on option. It should be an exception class or a tuple of them.")
+        columns = step_options.get("columns")
+        if columns is not None:
+            if isinstance(columns, str) or not all(isinstance(column, str) for column in columns):
+                raise ValueError("Invalid columns option. It should be a list of column names.")
+            step_options["columns"] = list(columns)
+        for option in ["retry_delay", "backoff", "timeout"]:
+            value = step_options.get(option)
+            if value is not None and (not isinstance(value, (int, float)) or value < 0):
+                raise ValueError(f"Invalid {option} option. It should be a non-negative number of seconds.")
+
+    def register_function(self, category: str, comment: Optional[str] = None, **step_options) -> Callable[..., Any]:
+        """Register a function in the specified category, along with options for running it in a pipeline."""
+        self._validate_step_options(step_options)
 
         def decorator(func: Callable) -> Callable:
-            func_name = func.__name__
+            func_name = self.qualify(func.__name__)
             func.__category__ = category
-            self.functions[category][func_name] = {
+            func.__step_options__ = step_options
+            self.add_function(category, func_name, comment, func)
+            return func
+
+        return decorator
+
+    def register_module(self, module: Union[str, ModuleType], category: Union[str, Callable[[Callable], Optional[str]]],
+                        **step_options) -> List[str]:
+        """Register every public function defined in a module and return the names they were registered under.
+
+        `category` is either the category of all the functions, or a callable returning the category of a
+        function, or None to skip it. The first line of each function's docstring is used as its comment.
+        """
+        return self._register_modules([module], category, step_options)
+
+    def register_package(self, package: Union[str, ModuleType], category: Union[str, Callable[[Callable], Optional[str]]],
+                         max_workers: Optional[int] = None, **step_options) -> List[str]:
+        """Register every public function defined in a package and its submodules, like register_module.
+
+        With max_workers, the submodules are imported on a thread pool.
+        """
+        if isinstance(package, str):
+            package = importlib.import_module(package)
+        module_names = [info.name for info in pkgutil.walk_packages(package.__path__, package.__name__ + ".")]
+        if max_workers is not None:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                modules = list(pool.map(importlib.import_module, module_names))
+        else:
+            modules = [importlib.import_module(name) for name in module_names]
+        return self._register_modules([package] + modules, category, step_options)
+
+    def _register_modules(self, modules: List[Union[str, ModuleType]],
+                          category: Union[str, Callable[[Callable], Optional[str]]],
+                          step_options: Dict[str, Any]) -> List[str]:
+        self._validate_step_options(step_options)
+        entries = []
+        for module in modules:
+            if isinstance(module, str):
+                module = importlib.import_module(module)
+            for attribute, func in vars(module).items():
+                if attribute.startswith("_") or not inspect.isfunction(func) or func.__module__ != module.__name__:
+                    continue
+                func_category = category(func) if callable(category) else category
+                if func_category is None:
+                    continue
+                func.__category__ = func_category
+                func.__step_options__ = step_options
+                comment = (inspect.getdoc(func) or "").split("\n")[0] or None
+                entries.append((func_category, self.qualify(func.__name__), comment, func))
+        self.add_functions(entries)
+        return [name for _, name, _, _ in entries]
+
+    def add_functions(self, entries: List[Tuple[str, str, Optional[str], Callable]]) -> None:
+        """Add many (category, name, comment, function) entries to the registry and the search index at once.
+
+        Raises a ValueError if a name is taken, in its category, by another function. A function
+        can still be registered again, e.g. after its module was reloaded.
+        """
+        registered: Dict[Tuple[str, str], Callable] = {}
+        for category, func_name, _, func in entries:
+            existing = registered.get((category, func_name)) or self.get_function(category, func_name)
+            if existing is not None and not self._is_same_function(existing, func):
+                raise ValueError(f"Function '{func_name}' is already registered in category '{category}' by "
+                                 f"{existing.__module__}.{existing.__qualname__}.")
+            registered[(category, func_name)] = func
+
+        for category, func_name, comment, func in entries:
+            if category not in self.categories:
+                self.categories.append(category)
+            self.functions.setdefault(category, {})[func_name] = {
                 'comment': comment,
                 'function': func
             }
-            return func
+        self.search_index.add_many(entries)
 
-        return decorator
+    @staticmethod
+    def _is_same_function(func: Callable, other: Callable) -> bool:
+        return (func.__module__, func.__qualname__) == (other.__module__, other.__qualname__)
+
+    def merge(self, other: "CategoryRegister") -> None:
+        """Add the functions of another register, e.g. the one of another team's namespace, to this one."""
+        self.add_functions([
+            (category, func_name, func_data["comment"], func_data["function"])
+            for category, category_functions in other.functions.items()
+            for func_name, func_data in category_functions.items()
+        ])
+        for category in other.categories:
+            if category not in self.categories:
+                self.categories.append(category)
+
+    def get_function(self, category: str, func_name: str) -> Optional[Callable]:
+        """Return the function registered under a name, qualified with its namespace, in a category."""
+        func_data = self.functions.get(category, {}).get(func_name)
+        return func_data["function"] if func_data is not None else None
+
+    def add_function(self, category: str, func_name: str, comment: Optional[str], func: Callable) -> None:
+        """Add a function to the registry and the search index."""
+        if category not in self.categories:
+            self.categories.append(category)
+        self.functions.setdefault(category, {})[func_name] = {
+            'comment': comment,
+            'function': func
+        }
+        self.search_index.add(category, func_name, comment, func)
+
+    def save_index(self, path: str) -> None:
+        """Persist the registered functions, with their source, to an index file."""
+        RegistryIndex.save(self.functions, path)
+
+    def load_index(self, path: str) -> None:
+        """Register the functions of an index file. Their modules are imported when they are first called."""
+        for lazy_function in RegistryIndex.load(path):
+            self.add_function(lazy_function.__category__, lazy_function.__registered_name__, lazy_function.__comment__,
+                              lazy_function)
+
+    @staticmethod
+    def get_step_options(func: Callable) -> Dict[str, Any]:
+        """Return the options a function was registered with."""
+        return getattr(func, "__step_options__", {})
     
     def get_functions_by_category(self, category_name: str) -> Dict[str, Optional[str]]:
         return self.functions.get(category_name, {})
@@ -52,18 +232,13 @@ class CategoryRegister:
             "functions": {},
         }
         
-        def format_function(func: Callable) -> str:
-            lines = inspect.getsource(func).split('\n')
-            dedented_lines = textwrap.dedent('\n'.join(lines)).split('\n')
-            return CategoryRegister._remove_decorator('\n'.join(dedented_lines))
-
         if category_name is None:
             function_data["functions"] = {
                 category: [
                     {
                         "name": func_name,
                         "comment": func_data['comment'] or "no comment",
-                        "function definition": format_function(func_data['function']) if include_function else "Not Displayed"
+                        "function definition": FunctionSource.get_clean_source(func_data['function']) if include_function else "Not Displayed"
                     }
                     for func_name, func_data in functions.items()
                 ]
@@ -76,7 +251,7 @@ class CategoryRegister:
                     {
                         "name": func_name,
                         "comment": func_data['comment'] or "no comment",
-                        "function definition": format_function(func_data['function']) if include_function else "Not Displayed"
+                        "function definition": FunctionSource.get_clean_source(func_data['function']) if include_function else "Not Displayed"
                     }
                     for func_name, func_data in self.functions[category_name].items()
                 ],
@@ -87,81 +262,139 @@ class CategoryRegister:
 
         print(json.dumps(function_data, indent=4, default=str))
         
-    @staticmethod
-    def _remove_decorator(func_str: str) -> str:
-        """Remove the decorator from the function source code."""
-        pattern = r"@\w+\.[a-z_]+\(.+?\)\n"
-        match = re.search(pattern, func_str)
-        if match:
-            func_str = func_str[: match.start()] + func_str[match.end() :]
-        return func_str
-        
-                
-    def write_category_to_file(self, category_name: str, output_directory: str = ".") -> None:
-        """Write functions in a specific category or all categories into a script file."""
-        if category_name.lower() == "all":
-            for category in self.functions:
-                self._write_single_category_to_file(category, output_directory)
-        else:
-            self._write_single_category_to_file(category_name, output_directory)
+    def write_category_to_file(self, category_name: str, output_directory: str = ".",
+                               incremental: bool = False) -> List[str]:
+        """Write functions in a specific category or all categories into a script file.
 
-    def _write_single_category_to_file(self, category_name: str, output_directory: str) -> None:
-        if category_name not in self.functions:
-            print(f"Category '{category_name}' not found.")
-            return
+        Every file is written atomically and a hash of its functions is recorded in a manifest in the output
+        directory. With incremental=True, a category is only written again if its functions, their comments
+        or their modules' imports changed, or if its file was modified. Returns the categories written.
+        """
+        categories = list(self.functions) if category_name.lower() == "all" else [category_name]
+        manifest_path = os.path.join(output_directory, self.EXPORT_MANIFEST)
+        manifest = self._load_export_manifest(manifest_path)
+        written = []
+        unique_imports = None
+        for category in categories:
+            if category not in self.functions:
+                print(f"Category '{category}' not found.")
+                continue
+            output_path = os.path.join(output_directory, f"{category}.py")
+            functions_hash = self._hash_category(category)
+            entry = manifest.get(category)
+            if (incremental and entry is not None and entry["functions"] == functions_hash
+                    and entry["file"] == self._hash_file(output_path)):
+                continue
+            if unique_imports is None:
+                # Scan the imports once for every category, and only if one has to be written
+                unique_imports = ImportExtractor().get_unique_imports(os.getcwd())
+            content = self._render_category(category, unique_imports)
+            write_atomically(output_path, content)
+            manifest[category] = {"functions": functions_hash, "file": hashlib.sha256(content.encode()).hexdigest()}
+            written.append(category)
+        if written:
+            write_atomically(manifest_path, json.dumps(manifest, indent=4))
+        return written
+
+    def _render_category(self, category_name: str, unique_imports: List[str]) -> str:
+        extractor = ImportExtractor()
+        functions = [func_data["function"] for func_data in self.functions[category_name].values()]
+        sources = [FunctionSource.get_clean_source(func) for func in functions]
+        # Only import what the functions of this category actually use
+        function_imports = extractor.get_function_imports(functions, sources, unique_imports)
 
-        def format_function(func: Callable) -> str:
-            lines = inspect.getsource(func).split('\n')
-            dedented_lines = textwrap.dedent('\n'.join(lines)).split('\n')
-            return CategoryRegister._remove_decorator('\n'.join(dedented_lines))
+        lines = ["# This script was generated by FlowPilot\n", "# Imports\n"]
+        for import_line in function_imports:
+            lines.append("try:\n")
+            lines.append(f"    {import_line}\n")
+            lines.append("except ImportError as e:\n")
+            lines.append(f"    print(f'Failed to import: {{e}}')\n")
+        lines.append("\n")
 
-        file_name = f"{category_name}.py"
-        output_path = os.path.join(output_directory, file_name)
+        lines.append("# Functions\n")
+        for source in sources:
+            lines.append(source)
+            lines.append("\n\n")
+        return "".join(lines)
 
+    def _hash_category(self, category_name: str) -> str:
+        """Hash what the exported file of a category is generated from."""
+        digest = hashlib.sha256()
         extractor = ImportExtractor()
-        unique_imports = extractor.get_unique_imports(os.getcwd())
-
-        with open(output_path, "w") as file:
-            file.write("# This script was generated by FlowPilot\n")
-            file.write("# Imports\n")
-            # Write imports
-            for import_line in unique_imports:
-                file.write("try:\n")
-                file.write(f"    {import_line}\n")
-                file.write("except ImportError as e:\n")
-                file.write(f"    print(f'Failed to import: {{e}}')\n")
-            file.write("\n")
-
-            # Write functions
-            file.write("# Functions\n")
-            for func_name, func_data in self.functions[category_name].items():
-                file.write(format_function(func_data["function"]))
-                file.write("\n\n")
+        for func_name, func_data in self.functions[category_name].items():
+            func = func_data["function"]
+            digest.update(f"{func_name}\0{func_data['comment']}\0".encode())
+            digest.update(FunctionSource.get_clean_source(func).encode())
+            # The imports of the defining module decide the imports written for the function
+            source_file = FunctionSource.get_source_file(func)
+            if source_file and os.path.isfile(source_file):
+                digest.update("\n".join(extractor.get_import_list([source_file])[0]).encode())
+        return digest.hexdigest()
 
+    @staticmethod
+    def _hash_file(path: str) -> Optional[str]:
+        try:
+            with open(path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _load_export_manifest(path: str) -> Dict[str, Dict[str, str]]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def watch(self, output_directory: str = ".", interval: float = 0.2, stop_event: Optional[threading.Event] = None,
+              on_export: Optional[Callable[[List[str]], None]] = None) -> None:
+        """Keep the exported files of every category up to date until stop_event is set.
+
+        The source files of the registered functions are polled every `interval` seconds and the categories
+        are exported incrementally when one of them, or the registered functions, change. `on_export`
+        receives the categories written.
+        """
+        stop_event = stop_event or threading.Event()
+        self.write_category_to_file("all", output_directory, incremental=True)
+        stamps = self._get_source_stamps()
+        while not stop_event.wait(interval):
+            current_stamps = self._get_source_stamps()
+            if current_stamps == stamps:
+                continue
+            stamps = current_stamps
+            written = self.write_category_to_file("all", output_directory, incremental=True)
+            if written and on_export is not None:
+                on_export(written)
+
+    def _get_source_stamps(self) -> Dict[str, Any]:
+        """Return the modification time and size of the source files of the registered functions."""
+        stamps: Dict[str, Any] = {"registered": [(category, len(functions)) for category, functions in self.functions.items()]}
+        for category_functions in self.functions.values():
+            for func_data in category_functions.values():
+                source_file = FunctionSource.get_source_file(func_data["function"])
+                if source_file is not None and source_file not in stamps:
+                    try:
+                        stat = os.stat(source_file)
+                        stamps[source_file] = (stat.st_mtime_ns, stat.st_size)
+                    except OSError:
+                        stamps[source_file] = None
+        return stamps
 
-    
     def search_functions(self, search_query: str, search_field: Optional[str] = None, case_sensitive: bool = False) -> List[Dict[str, str]]:
         """Search for functions based on name, category, or comment."""
         if search_field not in [None, "name", "category", "comment"]:
             raise ValueError("Invalid search_field. It should be one of 'name', 'category', or 'comment'.")
+        return self.search_index.search(search_query, search_field, case_sensitive)
+
+    def find_functions(self, value: str, search_field: str = "name", prefix: bool = False) -> List[Dict[str, str]]:
+        """Find functions whose name or category is equal to, or starts with, a value (ignoring case)."""
+        if search_field not in ["name", "category"]:
+            raise ValueError("Invalid search_field. It should be one of 'name' or 'category'.")
+        if prefix:
+            return self.search_index.find_prefix(value, search_field)
+        return self.search_index.find_exact(value, search_field)
 
-        if not case_sensitive:
-            search_query = search_query.lower()
-
-        def match(item: str) -> bool:
-            if not case_sensitive:
-                item = item.lower()
-            return bool(re.search(search_query, item or ""))
-
-        search_results = [
-            {"name": func_name, "category": category, "comment": func_data['comment']}
-            for category, functions in self.functions.items()
-            for func_name, func_data in functions.items()
-            if (
-                (search_field is None and (match(func_name) or match(category) or match(func_data['comment'])))
-                or (search_field == "name" and match(func_name))
-                or (search_field == "category" and match(category))
-                or (search_field == "comment" and match(func_data['comment']))
-            )
-        ]
-        return search_results
\ No newline at end of file
+    def search_text(self, query: str, include_source: bool = True) -> List[Dict[str, str]]:
+        """Search for functions whose comment or source contains every word of the query."""
+        return self.search_index.search_text(query, include_source)
@@ -0,0 +1,112 @@
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional
+
+
+class ColumnarRef:
+    """Picklable reference to a DataFrame in a ColumnarStore, mapped into memory when loaded."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self, mmap: bool = True) -> Any:
+        return ColumnarStore.read_path(self.path, mmap)
+
+    def __repr__(self) -> str:
+        return f"<ColumnarRef {self.path}>"
+
+
+class ColumnarStore:
+    """On-disk storage of DataFrames with one NumPy .npy file per column.
+
+    Numeric, boolean and datetime columns are memory-mapped when read back: processes
+    reading the same DataFrame share the pages of the files and nothing is deserialized.
+    Other columns (objects, strings, categoricals...) and the index are pickled.
+    Mapped columns are copy-on-write, so in-place changes never modify the stored data.
+    """
+
+    META_FILE = "meta.pkl"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def supports(value: Any) -> bool:
+        """Check whether a value can be stored, i.e. whether it is a DataFrame."""
+        try:
+            import pandas as pd
+        except ImportError:
+            return False
+        return isinstance(value, pd.DataFrame)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.path(key), self.META_FILE))
+
+    def write(self, key: str, df: Any) -> ColumnarRef:
+        """Store a DataFrame under a key, replacing any previous one, and return a reference to it."""
+        import numpy as np
+
+        # Write into a temporary directory and rename it, so that readers never see a partial entry
+        temp_path = tempfile.mkdtemp(dir=self.directory, suffix=".tmp")
+        columns = []
+        for position, (label, column) in enumerate(df.items()):
+            values = column.to_numpy() if isinstance(column.dtype, np.dtype) else None
+            if values is not None and values.dtype.kind in "biufcmM":
+                file_name = f"{position}.npy"
+                np.save(os.path.join(temp_path, file_name), values, allow_pickle=False)
+            else:
+                file_name = f"{position}.pkl"
+                with open(os.path.join(temp_path, file_name), "wb") as f:
+                    pickle.dump(column.array, f, protocol=pickle.HIGHEST_PROTOCOL)
+            columns.append((label, file_name))
+
+        meta = {"columns": columns, "index": df.index, "column_names": df.columns.names, "attrs": df.attrs}
+        with open(os.path.join(temp_path, self.META_FILE), "wb") as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.delete(key)
+        os.replace(temp_path, self.path(key))
+        return ColumnarRef(self.path(key))
+
+    def read(self, key: str, mmap: bool = True) -> Any:
+        return self.read_path(self.path(key), mmap)
+
+    @classmethod
+    def read_path(cls, path: str, mmap: bool = True) -> Any:
+        """Read a stored DataFrame, memory-mapping its NumPy columns unless mmap=False."""
+        import numpy as np
+        import pandas as pd
+
+        with open(os.path.join(path, cls.META_FILE), "rb") as f:
+            meta = pickle.load(f)
+        data: Dict[int, Any] = {}
+        for position, (_, file_name) in enumerate(meta["columns"]):
+            file_path = os.path.join(path, file_name)
+            if file_name.endswith(".npy"):
+                data[position] = np.load(file_path, mmap_mode="c" if mmap else None)
+            else:
+                with open(file_path, "rb") as f:
+                    data[position] = pickle.load(f)
+
+        # Build the frame from positions, so that duplicate column labels are kept, without copying the columns
+        df = pd.DataFrame(data, index=meta["index"], copy=False)
+        df.columns = pd.Index([label for label, _ in meta["columns"]], tupleize_cols=True, name=None)
+        df.columns.names = meta["column_names"]
+        df.attrs = meta["attrs"]
+        return df
+
+    def delete(self, key: str) -> None:
+        shutil.rmtree(self.path(key), ignore_errors=True)
+
+    def size(self, key: str) -> int:
+        """Return the number of bytes stored for a key."""
+        return sum(entry.stat().st_size for entry in os.scandir(self.path(key)))
+
+    def keys(self) -> List[str]:
+        return [entry.name for entry in os.scandir(self.directory) if entry.is_dir() and not entry.name.endswith(".tmp")]
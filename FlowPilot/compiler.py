@@ -0,0 +1,279 @@
+import os
+import ast
+import types
+import inspect
+import builtins
+import importlib
+import sysconfig
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from category import *
+from function_source import *
+from import_extractor import *
+from registry_index import *
+
+
+class PipelineCompiler:
+    """Compile the steps of a pipeline into a standalone script.
+
+    The script holds only the functions used by the steps, without their registration decorators,
+    the imports, constants and helper functions these functions need, and a `main()` calling the steps
+    in order with their arguments. Running it does not import FlowPilot at all.
+    """
+
+    def __init__(self, fallback_imports: Optional[List[str]] = None):
+        # Imports used to resolve names which the module defining a function doesn't import itself
+        self.fallback_imports = fallback_imports
+        self.functions: Dict[str, Callable] = {}
+        # Imports of the library callables and modules the script refers to by name
+        self.imports: List[str] = []
+        # Sources of the literal constants the functions read, and of the other names functions are read by
+        self.constants: Dict[str, str] = {}
+        self.aliases: Dict[str, str] = {}
+
+    @staticmethod
+    def get_definition_source(func: Callable) -> str:
+        """Return the source of a function starting at its `def` line, dropping every decorator."""
+        source = FunctionSource.get_clean_source(func)
+        tree = ast.parse(source)
+        definition = tree.body[0]
+        if not isinstance(definition, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            raise ValueError(f"The source of '{func.__name__}' is not a function definition.")
+        return "\n".join(source.splitlines()[definition.lineno - 1:]).rstrip() + "\n"
+
+    @staticmethod
+    def format_value(value: Any, step_name: str) -> str:
+        """Return the source of an argument, which has to be a Python literal to be written to a script."""
+        text = repr(value)
+        try:
+            ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            raise ValueError(f"Argument {text} of step '{step_name}' is not a literal and can't be written to a script.")
+        return text
+
+    def _add_function(self, func: Callable) -> str:
+        """Include a function in the script and return the name to call it by."""
+        name = func.__name__
+        included = self.functions.setdefault(name, func)
+        if included is not func and FunctionSource.get_source(included) != FunctionSource.get_source(func):
+            raise ValueError(f"Two different functions named '{name}' are used by the pipeline.")
+        return name
+
+    @staticmethod
+    def _add_definition(definitions: Dict[str, str], name: str, text: str):
+        """Define a name in the script, which has to have a single value."""
+        defined = definitions.setdefault(name, text)
+        if defined != text:
+            raise ValueError(f"Two different values named '{name}' are used by the pipeline.")
+
+    def _add_import(self, import_line: str):
+        """Add an import to the script, once."""
+        if import_line not in self.imports:
+            self.imports.append(import_line)
+
+    @staticmethod
+    def is_library_callable(func: Callable) -> bool:
+        """Check whether a callable is a builtin or comes from the standard library or an installed package."""
+        if not inspect.isfunction(func):
+            return True
+        source_file = FunctionSource.get_source_file(func)
+        if source_file is None:
+            return False
+        library_paths = {sysconfig.get_paths()[key] for key in ["stdlib", "platstdlib", "purelib", "platlib"]}
+        source_file = os.path.abspath(source_file)
+        return any(source_file.startswith(os.path.join(path, "")) for path in library_paths)
+
+    @staticmethod
+    def get_import_path(obj: Any) -> Optional[Tuple[str, str]]:
+        """Return the module and qualified name an object can be imported by, None if it can't be."""
+        module_name = getattr(obj, "__module__", None)
+        qualname = getattr(obj, "__qualname__", getattr(obj, "__name__", None))
+        if module_name == "__main__":
+            return None
+        try:
+            target = importlib.import_module(module_name)
+            for attribute in qualname.split("."):
+                target = getattr(target, attribute)
+        except (ImportError, AttributeError, TypeError, ValueError):
+            return None
+        return (module_name, qualname) if target is obj else None
+
+    def _reference_callable(self, func: Callable, step_name: str) -> str:
+        """Return the name to call a callable by: library callables are imported, user functions are included."""
+        if not self.is_library_callable(func):
+            return self._add_function(func)
+        qualname = getattr(func, "__qualname__", getattr(func, "__name__", None))
+        if getattr(func, "__module__", None) == "builtins" and getattr(builtins, qualname or "", None) is func:
+            return qualname
+        import_path = self.get_import_path(func)
+        if import_path is None:
+            raise ValueError(f"Callable {func!r} of step '{step_name}' can't be imported by name in a script.")
+        module_name, qualname = import_path
+        self._add_import(f"import {module_name}")
+        return f"{module_name}.{qualname}"
+
+    @staticmethod
+    def get_global_values(func: Callable) -> Dict[str, Any]:
+        """Return the values of the module globals and enclosing variables the code of a function reads."""
+        code = getattr(func, "__code__", None)
+        if code is None:
+            return {}
+        names = set()
+        # Comprehensions and nested functions have their own code objects
+        code_objects = [code]
+        while code_objects:
+            code_object = code_objects.pop()
+            names.update(code_object.co_names)
+            code_objects.extend(const for const in code_object.co_consts if isinstance(const, types.CodeType))
+        values = {name: func.__globals__[name] for name in names if name in func.__globals__}
+        for name, cell in zip(code.co_freevars, func.__closure__ or ()):
+            try:
+                values[name] = cell.cell_contents
+            except ValueError:
+                # The enclosing variable isn't assigned yet
+                continue
+        return values
+
+    def _add_global(self, name: str, value: Any, func_name: str):
+        """Make a value read by a function available in the script under the name the function reads."""
+        if inspect.ismodule(value):
+            module_name = value.__name__
+            self._add_import(f"import {module_name}" if name == module_name else f"import {module_name} as {name}")
+        elif inspect.isfunction(value) and not self.is_library_callable(value):
+            included = self._add_function(value)
+            if included != name:
+                self._add_definition(self.aliases, name, included)
+        elif callable(value):
+            import_path = self.get_import_path(value)
+            if import_path is None or "." in import_path[1]:
+                raise ValueError(f"'{name}', used by '{func_name}', can't be imported by name in a script.")
+            module_name, qualname = import_path
+            alias = f" as {name}" if name != qualname else ""
+            self._add_import(f"from {module_name} import {qualname}{alias}")
+        else:
+            text = repr(value)
+            try:
+                ast.literal_eval(text)
+            except (ValueError, SyntaxError):
+                raise ValueError(f"'{name}', used by '{func_name}', is not a literal and can't be written to a script.")
+            self._add_definition(self.constants, name, text)
+
+    def _resolve_names(self, func: Callable, source: str, extractor: ImportExtractor,
+                       fallback: Dict[str, str]) -> List[str]:
+        """Return the imports providing the names a function reads.
+
+        Names are resolved with the imports of the module defining the function first, then with the
+        function's globals and enclosing variables, which are included in the script, then with the
+        fallback imports.
+        """
+        provided = extractor.index_by_bound_name(extractor.get_module_imports(func))
+        values = self.get_global_values(func)
+        imports = []
+        for name in extractor.referenced_names(source):
+            if name in provided:
+                imports.append(provided[name])
+            elif name in values:
+                self._add_global(name, values[name], func.__name__)
+            elif name in fallback:
+                imports.append(fallback[name])
+        return imports
+
+    def format_call(self, func: Callable, inputs: List[str], args: tuple, kwargs: Dict[str, Any],
+                    step_name: str) -> str:
+        """Return the expression computing the output of a step, following its step options."""
+        arguments = list(inputs)
+        arguments += [self.format_value(value, step_name) for value in args]
+        arguments += [f"{key}={self.format_value(value, step_name)}" for key, value in kwargs.items()]
+        call = f"{self._add_function(func)}({', '.join(arguments)})"
+        if inspect.iscoroutinefunction(func):
+            call = f"asyncio.run({call})"
+
+        options = CategoryRegister.get_step_options(func)
+        if options.get("fuse") == "filter":
+            call = f"{inputs[0]}[{call}]"
+        elif options.get("fuse") == "assign":
+            call = f"{inputs[0]}.assign(**{call})"
+        if options.get("combine") is not None:
+            call = f"{self._reference_callable(options['combine'], step_name)}([{call}])"
+        return call
+
+    def write(self, main_lines: List[str], output_path: str) -> str:
+        """Write the script with the included functions and the given body of `main()`."""
+        extractor = ImportExtractor()
+        fallback_imports = self.fallback_imports
+        if fallback_imports is None:
+            fallback_imports = extractor.get_unique_imports(os.getcwd())
+        fallback = extractor.index_by_bound_name(fallback_imports)
+
+        sources = []
+        imports = set()
+        # Helper functions read by the included functions are added to self.functions while it's walked
+        index = 0
+        while index < len(self.functions):
+            func = list(self.functions.values())[index]
+            index += 1
+            if isinstance(func, LazyFunction):
+                try:
+                    func = func.load()
+                except ImportError:
+                    # Functions defined in __main__ are only known by their saved source
+                    pass
+            source = self.get_definition_source(func)
+            sources.append(source)
+            imports.update(self._resolve_names(func, source, extractor, fallback))
+        functions = list(self.functions.values())
+        imports = sorted(imports)
+        imports += [import_line for import_line in self.imports if import_line not in imports]
+        if any(inspect.iscoroutinefunction(func) for func in functions) and "import asyncio" not in imports:
+            imports.append("import asyncio")
+
+        with open(output_path, "w") as file:
+            file.write("# This script was generated by FlowPilot from a pipeline\n")
+            file.write("# Imports\n")
+            for import_line in imports:
+                file.write(f"{import_line}\n")
+            file.write("\n\n")
+
+            if self.constants:
+                file.write("# Constants\n")
+                for name, text in self.constants.items():
+                    file.write(f"{name} = {text}\n")
+                file.write("\n\n")
+
+            file.write("# Functions\n")
+            for source in sources:
+                file.write(source)
+                file.write("\n\n")
+            if self.aliases:
+                for name, included in self.aliases.items():
+                    file.write(f"{name} = {included}\n")
+                file.write("\n\n")
+
+            file.write("def main():\n")
+            for line in main_lines:
+                file.write(f"    {line}\n")
+            file.write("\n\n")
+            file.write('if __name__ == "__main__":\n')
+            file.write("    main()\n")
+        return output_path
+
+    def compile_steps(self, steps: List[tuple], output_path: str) -> str:
+        """Compile sequential steps, each receiving the output of the previous one."""
+        main_lines = []
+        for index, (func, args, kwargs) in enumerate(steps):
+            inputs = ["data"] if index > 0 else []
+            main_lines.append(f"data = {self.format_call(func, inputs, args, kwargs, func.__name__)}")
+        main_lines.append("return data" if steps else "return None")
+        return self.write(main_lines, output_path)
+
+    def compile_graph(self, steps: List[tuple], step_names: List[str], dependencies: Dict[str, List[str]],
+                      output_path: str) -> str:
+        """Compile steps declaring their upstream steps, in the order they were added, returning the final outputs."""
+        main_lines = ["outputs = {}"]
+        consumed = {upstream for upstream_steps in dependencies.values() for upstream in upstream_steps}
+        for name, (func, args, kwargs) in zip(step_names, steps):
+            inputs = [f"outputs[{upstream!r}]" for upstream in dependencies[name]]
+            main_lines.append(f"outputs[{name!r}] = {self.format_call(func, inputs, args, kwargs, name)}")
+        final_steps = ", ".join(f"{name!r}: outputs[{name!r}]" for name in step_names if name not in consumed)
+        main_lines.append(f"return {{{final_steps}}}")
+        return self.write(main_lines, output_path)
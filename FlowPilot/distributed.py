@@ -0,0 +1,265 @@
+import os
+import shutil
+import sys
+import uuid
+import time
+import argparse
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, Future
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from columnar import *
+
+Address = Union[str, Tuple[str, int]]
+
+
+class DistributedExecutor(Executor):
+    """Executor sending tasks to worker processes which connect to it over TCP or a Unix socket.
+
+    The coordinator listens on `address`: a (host, port) tuple, port 0 picking a free port, or the path of a
+    Unix socket. Workers started with `run_worker`, `start_local_workers` or by running this module connect
+    to it and pull one task at a time. Functions are pickled by reference, so every worker has to be able to
+    import the modules defining them. Connections are authenticated with `authkey`.
+
+    A busy worker sends a heartbeat every `heartbeat_interval` seconds. When a worker disconnects or misses
+    its heartbeats for `heartbeat_timeout` seconds, its task goes back to the queue, up to `max_attempts` times.
+
+    With a `spill_directory` shared by the coordinator and the workers, DataFrames returned by a task (or in
+    the list or tuple it returns) are written to a ColumnarStore there and loaded back by the coordinator,
+    instead of being pickled over the connection.
+    """
+
+    def __init__(self, address: Address = ("127.0.0.1", 0), authkey: Optional[bytes] = None,
+                 heartbeat_interval: float = 1.0, heartbeat_timeout: float = 10.0, max_attempts: int = 3,
+                 spill_directory: Optional[str] = None):
+        self.authkey = authkey if authkey is not None else os.urandom(16)
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self.spill_directory = spill_directory
+        self._listener = Listener(address, authkey=self.authkey)
+        self.address: Address = self._listener.address
+        self._condition = threading.Condition()
+        self._queue: Deque[str] = deque()
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._workers: Dict[str, Connection] = {}
+        self._local_workers: List[multiprocessing.Process] = []
+        self._shutdown = False
+        threading.Thread(target=self._accept_workers, daemon=True).start()
+
+    @property
+    def worker_count(self) -> int:
+        return len(self._workers)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        future: Future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit tasks after shutdown.")
+            task_id = uuid.uuid4().hex
+            self._tasks[task_id] = {"future": future, "call": (fn, args, kwargs), "attempts": 0}
+            self._queue.append(task_id)
+            self._condition.notify_all()
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._condition:
+            if cancel_futures:
+                for task_id in list(self._queue):
+                    self._tasks.pop(task_id)["future"].cancel()
+                self._queue.clear()
+            if wait:
+                self._condition.wait_for(lambda: not self._tasks)
+            self._shutdown = True
+            self._condition.notify_all()
+        try:
+            # Wake up the thread waiting for connections, so that it sees the shutdown
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+        self._listener.close()
+        for process in self._local_workers:
+            process.join(timeout=self.heartbeat_timeout)
+
+    def start_local_workers(self, count: int) -> List[multiprocessing.Process]:
+        """Start worker processes on this machine, connected to this coordinator."""
+        processes = []
+        for _ in range(count):
+            process = multiprocessing.Process(target=run_worker, args=(self.address, self.authkey), daemon=True)
+            process.start()
+            processes.append(process)
+        self._local_workers.extend(processes)
+        return processes
+
+    def wait_for_workers(self, count: int, timeout: Optional[float] = None) -> bool:
+        """Wait until at least `count` workers are connected. Returns whether they are."""
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self._workers) >= count, timeout)
+
+    def _accept_workers(self) -> None:
+        while True:
+            try:
+                connection = self._listener.accept()
+            except (OSError, EOFError):
+                # Failed handshakes (e.g. a wrong authkey) are refused without stopping the coordinator
+                if self._shutdown:
+                    return
+                continue
+            if self._shutdown:
+                connection.close()
+                return
+            threading.Thread(target=self._serve_worker, args=(connection,), daemon=True).start()
+
+    def _next_task(self) -> Optional[str]:
+        with self._condition:
+            while True:
+                self._condition.wait_for(lambda: self._queue or self._shutdown)
+                if self._shutdown:
+                    return None
+                task_id = self._queue.popleft()
+                task = self._tasks[task_id]
+                if task["attempts"] == 0 and not task["future"].set_running_or_notify_cancel():
+                    # Cancelled while it was queued
+                    del self._tasks[task_id]
+                    self._condition.notify_all()
+                    continue
+                task["attempts"] += 1
+                return task_id
+
+    def _serve_worker(self, connection: Connection) -> None:
+        worker_id = uuid.uuid4().hex
+        task_id = None
+        try:
+            connection.send(("welcome", self.heartbeat_interval, self.spill_directory))
+            with self._condition:
+                self._workers[worker_id] = connection
+                self._condition.notify_all()
+            while True:
+                task_id = self._next_task()
+                if task_id is None:
+                    connection.send(("stop",))
+                    return
+                connection.send(("task", task_id) + self._tasks[task_id]["call"])
+                while True:
+                    if not connection.poll(self.heartbeat_timeout):
+                        raise TimeoutError(f"Worker {worker_id} missed its heartbeats.")
+                    message = connection.recv()
+                    if message[0] == "result":
+                        break
+                self._complete(task_id, *message[2:])
+                task_id = None
+        except (OSError, EOFError, TimeoutError):
+            # The worker died or hung: its task goes back to the queue
+            if task_id is not None:
+                self._requeue(task_id)
+        except Exception as e:
+            # E.g. the result could not be unpickled by the coordinator
+            if task_id is not None:
+                self._complete(task_id, False, e)
+        finally:
+            with self._condition:
+                self._workers.pop(worker_id, None)
+            connection.close()
+
+    def _complete(self, task_id: str, succeeded: bool, value: Any) -> None:
+        with self._condition:
+            task = self._tasks.pop(task_id)
+            self._condition.notify_all()
+        if succeeded:
+            task["future"].set_result(_unspill(value))
+        else:
+            task["future"].set_exception(value)
+
+    def _requeue(self, task_id: str) -> None:
+        with self._condition:
+            task = self._tasks[task_id]
+            if task["attempts"] < self.max_attempts:
+                self._queue.appendleft(task_id)
+                self._condition.notify_all()
+                return
+            del self._tasks[task_id]
+            self._condition.notify_all()
+        task["future"].set_exception(RuntimeError(f"Task failed on {task['attempts']} workers which died."))
+
+
+def run_worker(address: Address, authkey: bytes) -> None:
+    """Connect to a DistributedExecutor and run its tasks until it shuts down."""
+    connection = Client(address, authkey=authkey)
+    _, heartbeat_interval, spill_directory = connection.recv()
+    send_lock = threading.Lock()
+
+    def send(message: tuple) -> None:
+        with send_lock:
+            connection.send(message)
+
+    try:
+        while True:
+            message = connection.recv()
+            if message[0] == "stop":
+                return
+            _, task_id, fn, args, kwargs = message
+            busy = threading.Event()
+            busy.set()
+
+            def heartbeat() -> None:
+                while busy.is_set():
+                    time.sleep(heartbeat_interval)
+                    if busy.is_set():
+                        send(("heartbeat",))
+
+            threading.Thread(target=heartbeat, daemon=True).start()
+            try:
+                result = (True, _spill(fn(*args, **kwargs), spill_directory))
+            except Exception as e:
+                result = (False, e)
+            finally:
+                busy.clear()
+            try:
+                send(("result", task_id) + result)
+            except Exception:
+                # The result or the error could not be pickled
+                send(("result", task_id, False, RuntimeError(traceback.format_exc())))
+    except (OSError, EOFError):
+        return
+    finally:
+        connection.close()
+
+
+def _spill(value: Any, directory: Optional[str]) -> Any:
+    if directory is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return type(value)(_spill(item, directory) for item in value)
+    if ColumnarStore.supports(value):
+        return ColumnarStore(directory).write(uuid.uuid4().hex, value)
+    return value
+
+
+def _unspill(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unspill(item) for item in value)
+    if isinstance(value, ColumnarRef):
+        data = value.load(mmap=False)
+        shutil.rmtree(value.path, ignore_errors=True)
+        return data
+    return value
+
+
+def _parse_address(address: str) -> Address:
+    host, separator, port = address.rpartition(":")
+    return (host, int(port)) if separator and port.isdigit() else address
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a FlowPilot worker connected to a DistributedExecutor.")
+    parser.add_argument("address", help="host:port or Unix socket path of the coordinator.")
+    parser.add_argument("--authkey", required=True, help="Authentication key of the coordinator.")
+    parser.add_argument("--path", action="append", default=[],
+                        help="Directory to add to sys.path to import the registered functions. Can be repeated.")
+    arguments = parser.parse_args()
+    sys.path[:0] = arguments.path
+    run_worker(_parse_address(arguments.address), arguments.authkey.encode())
@@ -1,3 +1,4 @@
+import os
 from typing import Callable, Dict, List, Optional, Union, Any
 from functools import wraps
 
@@ -5,12 +6,13 @@ from category import *
 from project import *
 from pipes import *
 from import_extractor import *
+from testing import *
 
 class FlowPilot:
-    def __init__(self, project_name: str):
+    def __init__(self, project_name: str, namespace: Optional[str] = None):
         categories = ["data_reader", "data_transformer", "data_writer", "test"]
         self.project_name = project_name
-        self.category_register = CategoryRegister(categories)
+        self.category_register = CategoryRegister(categories, namespace)
         self.project = Project(self.project_name)
         self._create_shortcuts_for_categories(categories)
 
@@ -18,8 +20,8 @@ class FlowPilot:
     def _create_shortcuts_for_categories(self, categories: List[str]) -> Callable[..., Any]:
         """Create shortcuts for registering functions in categories."""
         def create_shortcut(cat: str):
-            def register_func(comment=None):
-                return self.register_function(cat, comment)
+            def register_func(comment=None, **step_options):
+                return self.register_function(cat, comment, **step_options)
             return register_func
 
         for category in categories:
@@ -30,19 +32,54 @@ class FlowPilot:
         self.category_register.create_new_category(name)
         self._create_shortcuts_for_categories([name])
 
-    def register_function(self, category: str, comment: Optional[str] = None) -> Callable[..., Any]:
+    def register_function(self, category: str, comment: Optional[str] = None, **step_options) -> Callable[..., Any]:
         """Register a function in a specific category."""
-        return self.category_register.register_function(category, comment)
+        return self.category_register.register_function(category, comment, **step_options)
 
     def is_valid_category(self, category_name: str) -> bool:
         """Check if the category name is valid."""
         return self.category_register.is_valid_category(category_name)
 
-    def custom(self, category_name: str, comment: Optional[str] = None) -> Callable[..., Any]:
+    def custom(self, category_name: str, comment: Optional[str] = None, **step_options) -> Callable[..., Any]:
         """Register a custom function in a category, creating the category if it does not exist."""
         if not self.category_register.is_valid_category(category_name):
             self.category_register.create_new_category(category_name)
-        return self.category_register.register_function(category_name, comment)
+        return self.category_register.register_function(category_name, comment, **step_options)
+
+    def register_module(self, module: Any, category: Union[str, Callable[[Callable], Optional[str]]],
+                        **step_options) -> List[str]:
+        """Register every public function of a module in one call and return the names they were registered under."""
+        return self._with_new_shortcuts(self.category_register.register_module, module, category, **step_options)
+
+    def register_package(self, package: Any, category: Union[str, Callable[[Callable], Optional[str]]],
+                         max_workers: Optional[int] = None, **step_options) -> List[str]:
+        """Register every public function of a package and its submodules, optionally importing them in parallel."""
+        return self._with_new_shortcuts(self.category_register.register_package, package, category, max_workers,
+                                        **step_options)
+
+    def merge(self, other: "FlowPilot") -> None:
+        """Add the functions registered in another FlowPilot, e.g. another team's namespace, to this one."""
+        self._with_new_shortcuts(self.category_register.merge, other.category_register)
+
+    def _with_new_shortcuts(self, register: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call a registering method and create the shortcuts of the categories it created."""
+        known_categories = list(self.category_register.categories)
+        result = register(*args, **kwargs)
+        self._create_shortcuts_for_categories(
+            [category for category in self.category_register.categories if category not in known_categories]
+        )
+        return result
+
+    def save_registry(self, path: Optional[str] = None) -> str:
+        """Persist the registered functions to an index file in the project directory and return its path."""
+        path = path or os.path.join(self.project.get_internal_directory(), RegistryIndex.FILE_NAME)
+        self.category_register.save_index(path)
+        return path
+
+    def load_registry(self, path: Optional[str] = None) -> None:
+        """Register the functions of an index file without importing their modules."""
+        path = path or os.path.join(self.project.get_internal_directory(), RegistryIndex.FILE_NAME)
+        self._with_new_shortcuts(self.category_register.load_index, path)
 
     def display_functions(self, category_name: Optional[str] = None, include_function: bool = False) -> None:
         """Display the functions registered in all categories."""
@@ -52,6 +89,14 @@ class FlowPilot:
     def search_functions(self, search_query: str, search_field: Optional[str] = None) -> None:
         """Search for functions based on name, category, or comment."""
         search_results = self.category_register.search_functions(search_query, search_field)
+        self._print_search_results(search_results)
+
+    def search_text(self, query: str, include_source: bool = True) -> None:
+        """Search for functions whose comment or source contains every word of the query."""
+        self._print_search_results(self.category_register.search_text(query, include_source))
+
+    @staticmethod
+    def _print_search_results(search_results: List[Dict[str, str]]) -> None:
         if search_results:
             print("Search results:")
             for result in search_results:
@@ -59,8 +104,31 @@ class FlowPilot:
         else:
             print("No matching functions found.")
             
-    def write_category_to_file(self, category_name: str, output_path: Optional[str] = None) -> None:
-        """Write the functions of a specified category to a script file along with the necessary imports."""
+    def run_tests(self, pattern: Optional[str] = None, search_field: str = "name", max_workers: Optional[int] = None,
+                  executor: str = "process", force: bool = False) -> List[Dict[str, Any]]:
+        """Run the functions of the test category, or those matching a search pattern, and print the results.
+
+        Tests which haven't changed since they last passed are skipped, unless force=True.
+        """
+        state_path = os.path.join(self.project.get_internal_directory(), "test_state.json")
+        runner = TestRunner(self.category_register, state_path, max_workers=max_workers, executor=executor)
+        results = runner.run(pattern, search_field, force)
+        runner.show(results)
+        return results
+
+    def write_category_to_file(self, category_name: str, output_path: Optional[str] = None,
+                               incremental: bool = False) -> List[str]:
+        """Write the functions of a specified category to a script file along with the necessary imports.
+
+        With incremental=True, only the categories whose functions changed since they were last written are written.
+        """
+        if output_path is None:
+            output_path = self.project_name
+        return self.category_register.write_category_to_file(category_name, output_path, incremental)
+
+    def watch(self, output_path: Optional[str] = None, interval: float = 0.2, stop_event: Optional[Any] = None,
+              on_export: Optional[Callable[[List[str]], None]] = None) -> None:
+        """Keep the exported scripts of every category up to date as the source files are edited, until stop_event is set."""
         if output_path is None:
             output_path = self.project_name
-        self.category_register.write_category_to_file(category_name, output_path)
+        self.category_register.watch(output_path, interval, stop_event, on_export)
@@ -0,0 +1,127 @@
+import os
+import re
+import ast
+import inspect
+import linecache
+import textwrap
+import weakref
+import functools
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+
+class FunctionSource:
+    """Source code of registered functions, extracted lazily and memoized.
+
+    Each function's source is extracted once. It is extracted again only when the
+    defining file's modification time or size change.
+    """
+
+    _cache: "weakref.WeakKeyDictionary[Callable, Tuple[Optional[Tuple[str, int, int]], str, str]]" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def remove_decorator(func_str: str) -> str:
+        """Remove the decorator from the function source code."""
+        pattern = r"@\w+\.[a-z_]+\(.+?\)\n"
+        match = re.search(pattern, func_str)
+        if match:
+            func_str = func_str[: match.start()] + func_str[match.end() :]
+        return func_str
+
+    @staticmethod
+    def get_source_file(func: Callable) -> Optional[str]:
+        """Return the path of the file defining a function."""
+        if hasattr(func, "__source_file__"):
+            return func.__source_file__
+        return getattr(getattr(func, "__code__", None), "co_filename", None)
+
+    @classmethod
+    def _file_key(cls, func: Callable) -> Optional[Tuple[str, int, int]]:
+        file_name = cls.get_source_file(func)
+        try:
+            stat = os.stat(file_name)
+        except (OSError, TypeError):
+            return None
+        return file_name, stat.st_mtime_ns, stat.st_size
+
+    @classmethod
+    def _get_entry(cls, func: Callable) -> Tuple[Optional[Tuple[str, int, int]], str, str]:
+        if hasattr(func, "__clean_source__"):
+            # Functions loaded from the registry index carry their source
+            return None, func.__source__, func.__clean_source__
+        file_key = cls._file_key(func)
+        entry = cls._cache.get(func)
+        if entry is not None and entry[0] == file_key:
+            return entry
+
+        source = None
+        if file_key is not None:
+            # Make inspect read the file again instead of serving its stale copy of the lines
+            linecache.checkcache(file_key[0])
+            source = cls._find_definition(file_key, func)
+        if source is None:
+            source = inspect.getsource(func)
+        clean_source = cls.remove_decorator(textwrap.dedent(source))
+        entry = (file_key, source, clean_source)
+        cls._cache[func] = entry
+        return entry
+
+    @classmethod
+    def _find_definition(cls, file_key: Tuple[str, int, int], func: Callable) -> Optional[str]:
+        """Find the source of a function in the current version of its file, by its qualified name.
+
+        Unlike inspect.getsource, this still finds the function after lines were added or removed above
+        it since it was defined. Among definitions with the same qualified name, the one starting
+        closest to the line the function was defined at is used. Returns None if there is none.
+        """
+        qualname = ".".join(name for name in func.__qualname__.split(".") if name != "<locals>")
+        candidates = cls._index_definitions(file_key).get(qualname)
+        if not candidates:
+            return None
+
+        def start(node: ast.AST) -> int:
+            return min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+
+        first_line = getattr(getattr(func, "__code__", None), "co_firstlineno", 0)
+        node = min(candidates, key=lambda candidate: abs(start(candidate) - first_line))
+        lines = cls._parse_file(file_key)[1]
+        return "".join(lines[start(node) - 1:node.end_lineno])
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _index_definitions(file_key: Tuple[str, int, int]) -> Dict[str, List[ast.AST]]:
+        """Map the qualified names, without `<locals>`, of the functions and classes of a file to their definitions.
+
+        Built once per version of the file, so that finding every function of a module doesn't walk it every time.
+        """
+        tree = FunctionSource._parse_file(file_key)[0]
+        index: Dict[str, List[ast.AST]] = {}
+        pending = [(tree, "")] if tree is not None else []
+        while pending:
+            node, prefix = pending.pop()
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    index.setdefault(prefix + child.name, []).append(child)
+                    pending.append((child, f"{prefix}{child.name}."))
+                else:
+                    pending.append((child, prefix))
+        return index
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _parse_file(file_key: Tuple[str, int, int]) -> Tuple[Optional[ast.AST], List[str]]:
+        # Keyed on the file's modification time and size, so an edited file is parsed again
+        lines = linecache.getlines(file_key[0])
+        try:
+            return ast.parse("".join(lines)), lines
+        except (SyntaxError, ValueError):
+            return None, lines
+
+    @classmethod
+    def get_source(cls, func: Callable) -> str:
+        """Return the source code of a function, as inspect.getsource does."""
+        return cls._get_entry(func)[1]
+
+    @classmethod
+    def get_clean_source(cls, func: Callable) -> str:
+        """Return the dedented source code of a function, without its registration decorator."""
+        return cls._get_entry(func)[2]
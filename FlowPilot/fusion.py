@@ -0,0 +1,104 @@
+from typing import Any, Callable, Dict, List
+
+from function_source import *
+from cache import *
+
+
+class FusedStep:
+    """Consecutive fusable data_transformer steps run as a single pass over a DataFrame.
+
+    A step registered with fuse="filter" returns a boolean row mask of its input and one
+    registered with fuse="assign" returns a dict of new columns. Outside of a fused step,
+    the mask or columns are applied to the input straight away. Within a fused step, the
+    masks of consecutive filters are computed against the same frame and combined, and the
+    rows are only selected once, before the next assign step or at the end. Fusable steps
+    must therefore be row-wise: the value they compute for a row may not depend on the
+    other rows.
+    """
+
+    FUSE_KINDS = ["filter", "assign"]
+
+    def __init__(self, steps: List[tuple]):
+        self.steps = steps
+        self.__name__ = f"fused({', '.join(func.__name__ for func, _, _ in steps)})"
+        self.__qualname__ = self.__name__
+        self.__category__ = "data_transformer"
+        self.__step_options__: Dict[str, Any] = {}
+        self.__source_file__ = None
+
+    @property
+    def __source__(self) -> str:
+        # The fused sources and bytecode identify the step for the step cache and incremental runs
+        return "\n".join(
+            StepCache.function_source(func) + StepCache.code_fingerprint(func) for func, _, _ in self.steps
+        )
+
+    @property
+    def __clean_source__(self) -> str:
+        return "\n".join(self.get_clean_source(func) for func, _, _ in self.steps)
+
+    @staticmethod
+    def get_clean_source(func: Callable) -> str:
+        """Return the clean source of a function, falling back to its bytecode, e.g. for functions defined in a REPL."""
+        try:
+            return FunctionSource.get_clean_source(func)
+        except (OSError, TypeError):
+            return StepCache.function_source(func)
+
+    @staticmethod
+    def get_fuse_kind(func: Callable) -> Any:
+        return getattr(func, "__step_options__", {}).get("fuse")
+
+    @staticmethod
+    def apply(kind: str, data: Any, result: Any) -> Any:
+        """Apply the mask or columns returned by a fusable step to its input."""
+        if kind == "filter":
+            return data[result]
+        return data.assign(**result)
+
+    def __call__(self, data: Any, *arguments: tuple) -> Any:
+        """Run the fused steps on a frame. `arguments` holds the (args, kwargs) of each step, see fuse_steps."""
+        arguments = arguments or tuple((step_args, step_kwargs) for _, step_args, step_kwargs in self.steps)
+        frame, mask = data, None
+        for (func, _, _), (step_args, step_kwargs) in zip(self.steps, arguments):
+            kind = self.get_fuse_kind(func)
+            if kind == "assign" and mask is not None:
+                # Rows removed by the filters before an assign step must not reach it, as they don't unfused
+                frame, mask = frame[mask], None
+            result = func(frame, *step_args, **step_kwargs)
+            if kind == "filter":
+                mask = result if mask is None else mask & result
+            else:
+                frame = frame.assign(**result)
+        return frame if mask is None else frame[mask]
+
+    def __repr__(self) -> str:
+        return f"<FusedStep {self.__name__}>"
+
+    @classmethod
+    def fuse_steps(cls, steps: List[tuple]) -> List[tuple]:
+        """Replace each run of two or more consecutive fusable transformers with a single FusedStep.
+
+        The args and kwargs of the fused steps are the args of the FusedStep, so that they are part of its
+        cache, incremental and checkpoint keys like those of any other step.
+        """
+        fused_steps: List[tuple] = []
+        group: List[tuple] = []
+
+        def flush() -> None:
+            if len(group) > 1:
+                arguments = tuple((step_args, step_kwargs) for _, step_args, step_kwargs in group)
+                fused_steps.append((cls(list(group)), arguments, {}))
+            else:
+                fused_steps.extend(group)
+            group.clear()
+
+        for step in steps:
+            func = step[0]
+            if func.__category__ == "data_transformer" and cls.get_fuse_kind(func) in cls.FUSE_KINDS:
+                group.append(step)
+            else:
+                flush()
+                fused_steps.append(step)
+        flush()
+        return fused_steps
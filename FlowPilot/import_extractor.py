@@ -1,11 +1,26 @@
-
 import os
 import re
-from typing import Callable, Dict, List, Optional, Union, Any
+import ast
+import json
+import builtins
+import fnmatch
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union, Any
 
 
 
 class ImportExtractor:
+    SOURCE_EXTENSIONS = (".py", ".ipynb")
+    IGNORED_DIRECTORIES = {".git", ".ipynb_checkpoints", "__pycache__", "env", "venv", ".venv", ".tox", ".nox",
+                           "site-packages", "node_modules"}
+    # Below this many files to (re)parse, starting a process pool costs more than it saves
+    PARALLEL_THRESHOLD = 64
+
+    # Imports per file, keyed on the file's (mtime, size), shared by all extractors in the process
+    _file_cache: Dict[str, Tuple[Tuple[int, int], List[str]]] = {}
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers
 
     @staticmethod
     def extract_all_imports(file_content: str, ignore_nesting: bool = False) -> List[str]:
@@ -39,29 +54,211 @@ class ImportExtractor:
     def filter_file_list(file_list: List[str]) -> List[str]:
         return [item for item in file_list if ".git" not in item and "env" not in item]
 
+    @staticmethod
+    def read_gitignore(directory: str) -> List[Tuple[str, bool, bool]]:
+        """Parse the .gitignore of a directory into (pattern, negated, directory_only) rules."""
+        rules = []
+        try:
+            with open(os.path.join(directory, ".gitignore")) as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return rules
+
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            line = line.lstrip("!")
+            directory_only = line.endswith("/")
+            rules.append((line.rstrip("/"), negated, directory_only))
+        return rules
+
+    @staticmethod
+    def is_ignored(relative_path: str, is_directory: bool, rules: List[Tuple[str, bool, bool]]) -> bool:
+        """Check a path, relative to the .gitignore's directory, against its rules. The last matching rule wins."""
+        ignored = False
+        name = os.path.basename(relative_path)
+        for pattern, negated, directory_only in rules:
+            if directory_only and not is_directory:
+                continue
+            if "/" in pattern:
+                matched = fnmatch.fnmatch(relative_path, pattern.lstrip("/"))
+            else:
+                matched = fnmatch.fnmatch(name, pattern)
+            if matched:
+                ignored = not negated
+        return ignored
+
+    def source_files_in_path(self, path: str) -> List[str]:
+        """List the .py and .ipynb files under a path, skipping ignored directories and .gitignore'd paths."""
+        files = []
+        # Each entry holds the directory of a .gitignore and its rules, inherited by the subdirectories
+        gitignores: Dict[str, List[Tuple[str, List[Tuple[str, bool, bool]]]]] = {}
+
+        for root, dirs, file_names in os.walk(path):
+            inherited = gitignores.pop(root, [])
+            rules = self.read_gitignore(root)
+            scopes = inherited + [(root, rules)] if rules else inherited
+
+            def ignored(name: str, is_directory: bool) -> bool:
+                full_path = os.path.join(root, name)
+                return any(
+                    self.is_ignored(os.path.relpath(full_path, scope_root).replace(os.sep, "/"), is_directory, scope_rules)
+                    for scope_root, scope_rules in scopes
+                )
+
+            dirs[:] = [
+                d for d in dirs
+                if d not in self.IGNORED_DIRECTORIES
+                and not os.path.exists(os.path.join(root, d, "pyvenv.cfg"))
+                and not ignored(d, True)
+            ]
+            for d in dirs:
+                gitignores[os.path.join(root, d)] = scopes
+            files.extend(
+                os.path.join(root, f) for f in file_names
+                if f.endswith(self.SOURCE_EXTENSIONS) and not ignored(f, False)
+            )
+        return files
+
+    @staticmethod
+    def read_source(file_name: str) -> str:
+        """Read the Python source of a file, joining the code cells of notebooks."""
+        with open(file_name, mode='r', encoding='utf-8', errors='ignore') as f:
+            content = f.read()
+        if file_name.endswith(".ipynb"):
+            cells = json.loads(content).get("cells", [])
+            content = "\n".join(
+                "".join(cell.get("source", [])) for cell in cells if cell.get("cell_type") == "code"
+            )
+        return content
+
+    @staticmethod
+    def extract_import_statements(file_content: str) -> List[str]:
+        """Return one import statement per name bound by the imports of a piece of source code.
+
+        `import os, json` gives 'import os' and 'import json', and `from typing import (Callable, Dict)`
+        gives 'from typing import Callable' and 'from typing import Dict'. Star imports are left out.
+        """
+        statements = []
+        for node in ast.walk(ast.parse(file_content)):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    statements.append(f"import {alias.name}" + (f" as {alias.asname}" if alias.asname else ""))
+            elif isinstance(node, ast.ImportFrom):
+                module = "." * node.level + (node.module or "")
+                for alias in node.names:
+                    if alias.name != "*":
+                        statements.append(f"from {module} import {alias.name}" + (f" as {alias.asname}" if alias.asname else ""))
+        return list(dict.fromkeys(statements))
+
+    @classmethod
+    def extract_file_imports(cls, file_name: str) -> List[str]:
+        try:
+            content = cls.read_source(file_name)
+        except (OSError, ValueError):
+            return []
+        try:
+            return cls.extract_import_statements(content)
+        except (SyntaxError, ValueError):
+            # Files which do not parse, like notebooks using shell magics, are scanned with the regexes
+            return cls.extract_all_imports(content)
+
     def get_import_list(self, file_list: List[str]) -> List[List[str]]:
-        import_list = []
-        for file_name in file_list:
+        """Return the imports of each file, in the order of `file_list`, only parsing the files which changed
+        since they were last parsed. Files which cannot be read have no imports."""
+        import_list: List[List[str]] = []
+        changed = []
+        for position, file_name in enumerate(file_list):
             try:
-                with open(file_name, mode='r') as f:
-                    file_content = f.read()
-                    import_list.append(self.extract_all_imports(file_content))
-            except:
-                pass
+                stat = os.stat(file_name)
+            except OSError:
+                import_list.append([])
+                continue
+            key = (stat.st_mtime_ns, stat.st_size)
+            cached = self._file_cache.get(file_name)
+            if cached is not None and cached[0] == key:
+                import_list.append(cached[1])
+            else:
+                import_list.append([])
+                changed.append((position, file_name, key))
+
+        if len(changed) >= self.PARALLEL_THRESHOLD:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                parsed = list(pool.map(self.extract_file_imports, [f for _, f, _ in changed], chunksize=16))
+        else:
+            parsed = [self.extract_file_imports(f) for _, f, _ in changed]
 
+        for (position, file_name, key), imports in zip(changed, parsed):
+            self._file_cache[file_name] = (key, imports)
+            import_list[position] = imports
         return import_list
 
     @staticmethod
     def make_unique_list(import_list: List[List[str]]) -> List[str]:
         flat_list = [item for sublist in import_list for item in sublist]
-        return list(set(flat_list))
+        return sorted(set(flat_list))
 
     @staticmethod
     def clean_list(import_list: List[str]) -> List[str]:
         return [item for item in import_list if item != 'import .']
 
     def get_unique_imports(self, path: str) -> List[str]:
-        files = self.filter_file_list(self.files_in_path(path))
+        files = self.source_files_in_path(path)
         import_list = self.get_import_list(files)
         unique_imports = self.make_unique_list(import_list)
         return self.clean_list(unique_imports)
+
+    @staticmethod
+    def bound_names(import_line: str) -> List[str]:
+        """Return the names an import statement binds, e.g. 'pd' for 'import pandas as pd'."""
+        try:
+            statement = ast.parse(import_line).body[0]
+        except (SyntaxError, IndexError):
+            return []
+        if isinstance(statement, ast.Import):
+            return [alias.asname or alias.name.split(".")[0] for alias in statement.names]
+        if isinstance(statement, ast.ImportFrom):
+            return [alias.asname or alias.name for alias in statement.names]
+        return []
+
+    @staticmethod
+    def referenced_names(source: str) -> List[str]:
+        """Return the non-builtin names read in a piece of source code."""
+        names = {
+            node.id for node in ast.walk(ast.parse(source))
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+        }
+        return sorted(name for name in names if not hasattr(builtins, name))
+
+    def get_function_imports(self, functions: List[Callable], sources: List[str],
+                             fallback_imports: Optional[List[str]] = None) -> List[str]:
+        """Return the imports providing the names used by the given functions.
+
+        A name is resolved with the imports of the module defining the function first, then
+        with `fallback_imports` (e.g. every import of the project). Names which no import
+        provides, like other functions or module constants, are left out.
+        """
+        fallback = self.index_by_bound_name(fallback_imports or [])
+        imports = set()
+        for func, source in zip(functions, sources):
+            provided = self.index_by_bound_name(self.get_module_imports(func))
+            for name in self.referenced_names(source):
+                import_line = provided.get(name) or fallback.get(name)
+                if import_line is not None:
+                    imports.add(import_line)
+        return sorted(imports)
+
+    def get_module_imports(self, func: Callable) -> List[str]:
+        """Return the imports of the module defining a function, none if its file can't be found."""
+        module_file = getattr(func, "__source_file__", None) or getattr(getattr(func, "__code__", None), "co_filename", None)
+        return self.get_import_list([module_file])[0] if module_file and os.path.isfile(module_file) else []
+
+    def index_by_bound_name(self, import_lines: List[str]) -> Dict[str, str]:
+        """Map each name bound by the given imports to the first import binding it."""
+        index: Dict[str, str] = {}
+        for import_line in sorted(import_lines):
+            for name in self.bound_names(import_line):
+                index.setdefault(name, import_line)
+        return index
@@ -0,0 +1,83 @@
+import os
+import uuid
+import pickle
+import shutil
+from typing import Any, Dict, List, Optional
+
+from columnar import *
+from profiling import *
+
+
+class SpilledRef:
+    """Reference to a value which isn't a DataFrame, pickled to disk to free memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self, mmap: bool = True) -> Any:
+        with open(self.path, "rb") as f:
+            return pickle.load(f)
+
+    def __repr__(self) -> str:
+        return f"<SpilledRef {self.path}>"
+
+
+class MemoryBudget:
+    """Keep the step outputs held in memory by a run under a number of bytes.
+
+    When the outputs tracked exceed the budget, the largest ones are spilled to disk: DataFrames to a
+    ColumnarStore, from which they are memory-mapped when read back, and any other value to a pickle file.
+    Values of unknown size (e.g. plain Python objects) count as 0 bytes and are never spilled.
+    """
+
+    def __init__(self, max_bytes: int, directory: str):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.store = ColumnarStore(os.path.join(directory, "columnar"))
+        self.sizes: Dict[str, int] = {}
+        self.paths: Dict[str, str] = {}
+
+    def track(self, name: str, value: Any) -> None:
+        self.sizes[name] = data_size(value, deep=True)[1] or 0
+
+    def release(self, name: str) -> None:
+        """Stop tracking an output which is no longer needed, deleting it from disk if it was spilled."""
+        self.sizes.pop(name, None)
+        path = self.paths.pop(name, None)
+        if path is not None and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif path is not None:
+            os.remove(path)
+
+    def used_bytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def enforce(self, values: Dict[str, Any]) -> List[str]:
+        """Spill the largest values, replacing them with a reference, until the tracked ones fit in the budget.
+
+        Returns the names of the values spilled.
+        """
+        spilled = []
+        while self.used_bytes() > self.max_bytes:
+            name = max(self.sizes, key=self.sizes.get)
+            if self.sizes[name] == 0:
+                break
+            values[name] = self.spill(name, values[name])
+            self.sizes[name] = 0
+            spilled.append(name)
+        return spilled
+
+    def spill(self, name: str, value: Any) -> Any:
+        """Write a value to disk and return a reference loading it."""
+        key = uuid.uuid4().hex
+        if self.store.supports(value):
+            ref = self.store.write(key, value)
+        else:
+            ref = SpilledRef(os.path.join(self.directory, f"{key}.pkl"))
+            with open(ref.path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.paths[name] = ref.path
+        return ref
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -1,14 +1,55 @@
-
+import os
+import sys
 import json
-from typing import Callable, Dict, List, Optional, Union, Any
-from functools import wraps
+import time
+import asyncio
+import inspect
+import uuid
+import shutil
+import itertools
+import contextlib
+import tracemalloc
+import weakref
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Callable, Dict, Iterable, List, Optional, Union, Any
+from functools import partial, wraps
 
 from flowpilot import *
+from cache import *
+from profiling import *
+from columnar import *
+from fusion import *
+from compiler import *
+from memory import *
+from pushdown import *
 
 class Pipeline:
-    def __init__(self, flow_pilot: FlowPilot):
+    HOOK_EVENTS = ["before_step", "after_step", "on_error"]
+
+    def __init__(self, flow_pilot: FlowPilot, cache: Union[bool, StepCache] = False, trace_memory: bool = False,
+                 intermediates: Optional[StepCache] = None, partition_workers: Optional[int] = None,
+                 partition_executor: Optional[Executor] = None):
         self.flow_pilot = flow_pilot
         self.steps = []
+        if cache is True:
+            cache = StepCache(directory=flow_pilot.project.get_internal_directory("cache"))
+        self.cache: Optional[StepCache] = cache or None
+        # Outputs retained by incremental runs. Created on the first incremental run unless one is given
+        self.intermediates = intermediates
+        # Outputs of the steps of checkpointed runs, kept on disk until the run completes
+        self.checkpoints: Optional[StepCache] = None
+        self.trace_memory = trace_memory
+        self.hooks: Dict[str, List[Callable]] = {event: [] for event in self.HOOK_EVENTS}
+        self.last_run_report: Optional[RunReport] = None
+        # Process pool running the partitions of steps registered with `partitions`, created when first needed in a
+        # run, unless an executor (e.g. a DistributedExecutor) is given
+        self.partition_workers = partition_workers
+        self.partition_executor = partition_executor
+        self._partition_pool: Optional[ProcessPoolExecutor] = None
+        # Sizes of the step outputs of the current run, by object id, so that a step's input isn't measured again
+        self._data_sizes: Dict[int, tuple] = {}
 
     def add_step(self, category: str, func: Callable, *args, **kwargs) -> None:
         self._validate_function_category(func, category)
@@ -21,15 +62,432 @@ class Pipeline:
         if func.__category__ != category:
             raise ValueError(f"Function '{func.__name__}' does not belong to category '{category}'.")
 
-    def execute(self) -> Any:
-        data = None
-        for step, step_args, step_kwargs in self.steps:
+    def add_hook(self, event: str, callback: Callable) -> None:
+        """Register a callback for a step event.
+
+        before_step and after_step callbacks receive the step record, on_error callbacks receive
+        the step record and the exception. The record is the dictionary stored in the run report.
+        """
+        if event not in self.HOOK_EVENTS:
+            raise ValueError(f"Invalid event. It should be one of {self.HOOK_EVENTS}.")
+        self.hooks[event].append(callback)
+
+    def _call_hooks(self, event: str, *args) -> None:
+        for callback in self.hooks[event]:
+            callback(*args)
+
+    def execute(self, stream: bool = False, incremental: bool = False, fuse: bool = False,
+                checkpoint: bool = False) -> Any:
+        """Execute the steps in order, passing each step's output to the next one.
+
+        With stream=True, a reader returning an iterator (e.g. `pd.read_csv(chunksize=...)`) is consumed chunk by
+        chunk: transformers are applied to each chunk, steps registered with a `combine` option reduce the chunks to
+        a single value and data_writer steps receive the iterator of chunks. If the last step is neither a reducer
+        nor a writer, the lazy iterator of chunks is returned.
+
+        With incremental=True, the output of every step is retained in `self.intermediates`. The next incremental
+        run resumes after the last step whose function source, args and kwargs, and those of every step before it,
+        are unchanged.
+
+        With fuse=True, runs of consecutive transformers registered with a `fuse` option are executed as a single
+        FusedStep. The run report then has one record per executed step, fused or not.
+
+        Columns and row filters used by the steps are pushed down to a first data_reader registered with
+        pushdown=True, see PushdownPlanner.
+
+        With checkpoint=True, the output of every step is written to disk under the project directory as soon as
+        it completes. A run of the same steps after a failed or killed one resumes after the last completed step.
+        The checkpoints are removed once the run completes, so the next run starts from the first step again.
+        """
+        if stream and (incremental or checkpoint):
+            raise ValueError("Streaming execution cannot be combined with incremental or checkpointed execution.")
+        if incremental and checkpoint:
+            raise ValueError("Incremental and checkpointed execution cannot be combined.")
+        steps, positions = self._plan_steps(fuse)
+        started_tracing = self._begin_run()
+        try:
+            if stream:
+                return self._execute_stream(steps, positions)
+
+            store = None
+            if incremental:
+                store = self._get_intermediates()
+            elif checkpoint:
+                store = self._get_checkpoints()
+            keys = self._get_chain_keys(steps, store) if store is not None else [None] * len(steps)
+            start, data = self._find_resume_point(keys, store) if store is not None else (0, None)
+            for index in range(start, len(steps)):
+                step, step_args, step_kwargs = steps[index]
+                inputs = [] if data is None else [data]
+                data = self._run_step(step, inputs, step_args, step_kwargs, index, positions=positions[index])
+                if keys[index] is not None:
+                    store.set(keys[index], data)
+            if checkpoint:
+                for key in keys:
+                    if key is not None:
+                        store.delete(key)
+            return data
+        finally:
+            self._end_run(started_tracing)
+
+    def _get_intermediates(self) -> StepCache:
+        if self.intermediates is None:
+            # Outputs are only written to disk when they don't fit in memory, rather than on every run
+            self.intermediates = StepCache(directory=self.flow_pilot.project.get_internal_directory("intermediates"),
+                                           write_through=False)
+        return self.intermediates
+
+    def _get_checkpoints(self) -> StepCache:
+        if self.checkpoints is None:
+            # Checkpoints are only read back after a failure, so they skip the memory tier and are never evicted
+            self.checkpoints = StepCache(directory=self.flow_pilot.project.get_internal_directory("checkpoints"),
+                                         max_memory_bytes=0, max_disk_bytes=sys.maxsize, durable=True)
+        return self.checkpoints
+
+    def _get_chain_keys(self, steps: Optional[List[tuple]] = None,
+                        store: Optional[StepCache] = None) -> List[Optional[str]]:
+        """Return a key per step identifying it and every step before it, None from the first unhashable step."""
+        store = store or self._get_intermediates()
+        keys: List[Optional[str]] = []
+        previous_key = ""
+        for step, step_args, step_kwargs in (self.steps if steps is None else steps):
+            key = store.make_key(step, [previous_key], step_args, step_kwargs) if previous_key is not None else None
+            keys.append(key)
+            previous_key = key
+        return keys
+
+    def _find_resume_point(self, keys: List[Optional[str]], store: StepCache) -> tuple:
+        """Return the index of the first step to run and its input, from the last retained step output."""
+        for index in range(len(keys) - 1, -1, -1):
+            if keys[index] is None:
+                continue
+            hit, data = store.get(keys[index])
+            if hit:
+                return index + 1, data
+        return 0, None
+
+    def get_dirty_steps(self) -> List[int]:
+        """Return the positions of the steps the next incremental run would execute."""
+        steps, positions = self._plan_steps()
+        keys = self._get_chain_keys(steps)
+        for index in range(len(keys) - 1, -1, -1):
+            if keys[index] is not None and self.intermediates.contains(keys[index]):
+                return list(range(positions[index][-1] + 1, len(self.steps)))
+        return list(range(len(self.steps)))
+
+    def _plan_steps(self, fuse: bool = False) -> tuple:
+        """Return the steps a run executes and, for each of them, the positions of the pipeline steps it runs."""
+        steps = PushdownPlanner.plan(self.steps)
+        # Filters pushed down to the reader are run by the reader, right after it
+        pushed_filters = len(self.steps) - len(steps)
+        positions = [[index] for index in range(pushed_filters + 1, len(self.steps))]
+        positions = [list(range(pushed_filters + 1))] + positions if steps else []
+        if fuse:
+            steps = FusedStep.fuse_steps(steps)
+            remaining = iter(positions)
+            positions = []
+            for step, _, _ in steps:
+                fused_count = len(step.steps) if isinstance(step, FusedStep) else 1
+                positions.append([position for _ in range(fused_count) for position in next(remaining)])
+        return steps, positions
+
+    def _execute_stream(self, steps: List[tuple], positions: List[List[int]]) -> Any:
+        # Steps mapped lazily over the chunks don't get a record in the run report
+        data, is_stream = None, False
+        for index, (step, step_args, step_kwargs) in enumerate(steps):
+            combine = CategoryRegister.get_step_options(step).get("combine")
             if data is None:
-                data = step(*step_args, **step_kwargs)
+                data = self._run_step(step, [], step_args, step_kwargs, index, positions=positions[index])
+                data, is_stream = _iter_chunks(data), True
+            elif is_stream and combine is not None:
+                record = self._begin_step(index, step.__name__, step, [data], positions[index])
+                result, metrics, error = measure_call(_reduce_chunks, (step, data, step_args, step_kwargs), self.trace_memory)
+                data, is_stream = self._end_step(record, result, metrics, error), False
+            elif is_stream and step.__category__ != "data_writer":
+                data = _map_chunks(step, data, step_args, step_kwargs)
             else:
-                data = step(data, *step_args, **step_kwargs)
+                data = self._run_step(step, [data], step_args, step_kwargs, index, positions=positions[index])
+                is_stream = False
         return data
+
+    def map(self, runs: Iterable[Any], max_workers: Optional[int] = None, ordered: bool = True, chunksize: int = 1,
+            max_pending: Optional[int] = None, executor: Union[str, Executor] = "process") -> Iterator:
+        """Execute the pipeline once per item of `runs` on a worker pool, yielding the results as they are ready.
+
+        Each run is either a dict mapping step positions (0-based) or function names to the step's arguments for
+        that run, or the arguments of the first step. Arguments are given as a tuple of args, a dict of kwargs
+        (merged into the step's kwargs) or a single arg:
+            pipeline.map(["day1.csv", "day2.csv"])
+            pipeline.map([{0: ("day1.csv",), "get_gender_only": {"gender": "male"}}])
+
+        Runs are sent to the workers in chunks of `chunksize`. `runs` is consumed lazily: at most `max_pending`
+        chunks (twice the number of workers by default) are submitted or waiting to be yielded at once. With
+        ordered=False, (index, result) pairs are yielded in completion order. Runs in workers don't use the
+        pipeline's cache, hooks or run report. Steps of a DAGPipeline are referred to by step name, and each run
+        executes them one at a time in a worker.
+
+        `executor` is "thread", "process" or an Executor instance, e.g. a DistributedExecutor, which is left
+        running afterwards.
+        """
+        # Validated here rather than in the generator, so that invalid arguments fail when map is called
+        if not isinstance(executor, Executor) and executor not in ["thread", "process"]:
+            raise ValueError("Invalid executor. It should be one of 'thread', 'process' or an Executor.")
+        if chunksize < 1:
+            raise ValueError("chunksize should be at least 1.")
+        return self._map(runs, max_workers, ordered, chunksize, max_pending, executor)
+
+    def _map(self, runs: Iterable[Any], max_workers: Optional[int], ordered: bool, chunksize: int,
+             max_pending: Optional[int], executor: Union[str, Executor]) -> Iterator:
+        runs = iter(runs)
+        chunks = enumerate(iter(lambda: list(itertools.islice(runs, chunksize)), []))
+        if isinstance(executor, Executor):
+            pool = executor
+            max_pending = max_pending or 2 * (max_workers or os.cpu_count() or 1)
+        else:
+            pool_class = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+            pool = pool_class(max_workers=max_workers)
+            max_pending = max_pending or 2 * pool._max_workers
+        pending: Dict[Any, int] = {}
+        finished: Dict[int, List[Any]] = {}
+        next_chunk = 0
+
+        def submit_chunks() -> None:
+            while len(pending) + len(finished) < max_pending:
+                chunk_index, chunk = next(chunks, (None, None))
+                if chunk is None:
+                    return
+                future = pool.submit(_execute_runs, [self._bind_run(run) for run in chunk])
+                pending[future] = chunk_index
+
+        try:
+            submit_chunks()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk_index = pending.pop(future)
+                    results = future.result()
+                    if ordered:
+                        finished[chunk_index] = results
+                    else:
+                        for offset, result in enumerate(results):
+                            yield chunk_index * chunksize + offset, result
+
+                while next_chunk in finished:
+                    yield from finished.pop(next_chunk)
+                    next_chunk += 1
+                submit_chunks()
+        finally:
+            if pool is executor:
+                for future in pending:
+                    future.cancel()
+            else:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def _bind_run(self, run: Any) -> Callable:
+        """Return a picklable callable executing a single map run in a worker."""
+        return partial(_execute_steps, PushdownPlanner.plan(self._bind_steps(run)))
+
+    def _get_step_positions(self) -> Dict[str, int]:
+        """Map the names steps can be referred to by in map runs to their positions."""
+        positions = {}
+        for index, (step, _, _) in enumerate(self.steps):
+            positions.setdefault(step.__name__, index)
+        return positions
+
+    def _bind_steps(self, run: Any) -> List[tuple]:
+        """Return the steps of the pipeline with the arguments of a single map run."""
+        overrides = run if isinstance(run, dict) else {0: run}
+        positions = self._get_step_positions()
+
+        steps = list(self.steps)
+        for step_key, arguments in overrides.items():
+            index = positions.get(step_key) if isinstance(step_key, str) else step_key
+            if index is None or not 0 <= index < len(steps):
+                raise ValueError(f"Pipeline has no step '{step_key}'.")
+            func, step_args, step_kwargs = steps[index]
+            if isinstance(arguments, tuple):
+                step_args = arguments
+            elif isinstance(arguments, dict):
+                step_kwargs = {**step_kwargs, **arguments}
+            else:
+                step_args = (arguments,)
+            steps[index] = (func, step_args, step_kwargs)
+        return steps
+
+    async def execute_async(self, max_concurrency: Optional[int] = None, semaphore: Optional[asyncio.Semaphore] = None,
+                            executor: Optional[Executor] = None) -> Any:
+        """Execute the steps in order on the running event loop.
+
+        `async def` steps are awaited and other steps are offloaded to `executor` (the loop's default executor
+        if None). At most `max_concurrency` steps are in flight at once. Pass the same `semaphore` to several
+        pipelines to bound the steps in flight across all of them.
+        """
+        semaphore = semaphore or (asyncio.Semaphore(max_concurrency) if max_concurrency else None)
+        started_tracing = self._begin_run()
+        try:
+            data = None
+            for index, (step, step_args, step_kwargs) in enumerate(self.steps):
+                inputs = [] if data is None else [data]
+                data = await self._run_step_async(step, inputs, step_args, step_kwargs, index, None, semaphore, executor)
+            return data
+        finally:
+            self._end_run(started_tracing)
+
+    async def _run_step_async(self, func: Callable, inputs: List[Any], step_args: tuple, step_kwargs: Dict[str, Any],
+                              index: int, step_name: Optional[str], semaphore: Optional[asyncio.Semaphore],
+                              executor: Optional[Executor]) -> Any:
+        record = self._begin_step(index, step_name or func.__name__, func, inputs)
+        cache_key = self._get_cache_key(func, inputs, step_args, step_kwargs)
+        if cache_key is not None:
+            hit, result = self.cache.get(cache_key)
+            if hit:
+                return self._end_step(record, result, status="cached")
+
+        options = CategoryRegister.get_step_options(func)
+        failures: List[BaseException] = []
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            if inspect.iscoroutinefunction(func):
+                call = (_call_step_async, (func, inputs, step_args, step_kwargs), options, failures)
+                result, metrics, error = await measure_call_async(_call_with_retries_async, call)
+            else:
+                loop = asyncio.get_running_loop()
+                call = (_call_step, (func, inputs, step_args, step_kwargs), options, failures)
+                result, metrics, error = await loop.run_in_executor(
+                    executor, measure_call, _call_with_retries, call, self.trace_memory
+                )
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+        record["retries"] = len(failures)
+        if error is None and cache_key is not None:
+            self.cache.set(cache_key, result)
+        return self._end_step(record, result, metrics, error)
+
+    def _begin_run(self) -> bool:
+        """Start a new run report. Returns whether memory tracing was started for this run."""
+        # The peak is process-wide, so resetting it would also reset that of any run going on concurrently
+        measure_peak_rss = self._measures_peak_rss()
+        if measure_peak_rss:
+            reset_peak_rss()
+        self.last_run_report = RunReport(measure_peak_rss)
+        # Trace for the whole run so that concurrent steps don't start and stop tracing under each other
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            return True
+        return False
+
+    def _measures_peak_rss(self) -> bool:
+        """Whether runs report the peak resident memory, which is only measured when tracing memory."""
+        return self.trace_memory
+
+    def _end_run(self, started_tracing: bool) -> None:
+        if self._partition_pool is not None:
+            self._partition_pool.shutdown()
+            self._partition_pool = None
+        self.last_run_report.finish()
+        self._data_sizes.clear()
+        if started_tracing:
+            tracemalloc.stop()
+
+    def _begin_step(self, index: int, step_name: str, func: Callable, inputs: List[Any],
+                    positions: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Create the record of a step about to run and call the before_step hooks.
+
+        `positions` are those of the pipeline steps the executed step runs, e.g. all the steps of a FusedStep.
+        """
+        input_sizes = [self._get_data_size(data) for data in inputs]
+        record = {
+            "index": index,
+            "positions": positions if positions is not None else [index],
+            "step_name": step_name,
+            "name": func.__name__,
+            "category": func.__category__,
+            "input_rows": _sum_known([rows for rows, _ in input_sizes]),
+            "input_bytes": _sum_known([size for _, size in input_sizes]),
+        }
+        self._call_hooks("before_step", record)
+        return record
+
+    def _end_step(self, record: Dict[str, Any], result: Any, metrics: Optional[Dict[str, Any]] = None,
+                  error: Optional[BaseException] = None, status: str = "ok") -> Any:
+        """Complete the record of a step, call the after_step or on_error hooks and return the step's result."""
+        record.update(metrics or {"wall_time": 0.0, "cpu_time": 0.0, "peak_memory": None})
+        if error is not None:
+            record.update(status="error", error=repr(error), output_rows=None, output_bytes=None)
+            self.last_run_report.add_step(record)
+            self._call_hooks("on_error", record, error)
+            raise error
+
+        record["status"] = status
+        record["output_rows"], record["output_bytes"] = self._get_data_size(result, reuse=False)
+        self.last_run_report.add_step(record)
+        self._call_hooks("after_step", record)
+        return result
+
+    def _get_data_size(self, data: Any, reuse: bool = True) -> tuple:
+        """Return the rows and bytes of a step's data, reusing those measured for the step which output it.
+
+        Bytes of DataFrames are only counted with trace_memory=True.
+        """
+        if reuse:
+            known = self._data_sizes.get(id(data))
+            if known is not None and known[0]() is data:
+                return known[1]
+        size = data_size(data, deep=self.trace_memory, count_bytes=self.trace_memory)
+        try:
+            self._data_sizes[id(data)] = (weakref.ref(data), size)
+        except TypeError:
+            # Lists, dicts and the like can't be referenced weakly, but measuring them is cheap
+            pass
+        return size
+
+    def _get_cache_key(self, func: Callable, inputs: List[Any], step_args: tuple,
+                       step_kwargs: Dict[str, Any]) -> Optional[str]:
+        """Return the cache key of a step call, or None when caching is disabled or not possible."""
+        if self.cache is None:
+            return None
+        return self.cache.make_key(func, inputs, step_args, step_kwargs)
+
+    def _run_step(self, func: Callable, inputs: List[Any], step_args: tuple, step_kwargs: Dict[str, Any],
+                  index: int = 0, step_name: Optional[str] = None, positions: Optional[List[int]] = None) -> Any:
+        """Run a single step, returning its cached result when the cache is enabled and holds it."""
+        record = self._begin_step(index, step_name or func.__name__, func, inputs, positions)
+        cache_key = self._get_cache_key(func, inputs, step_args, step_kwargs)
+        if cache_key is not None:
+            hit, result = self.cache.get(cache_key)
+            if hit:
+                return self._end_step(record, result, status="cached")
+
+        options = CategoryRegister.get_step_options(func)
+        partitions = options.get("partitions")
+        if partitions is not None and inputs and ColumnarStore.supports(_resolve(inputs[0])):
+            pool = self.partition_executor
+            if pool is None:
+                if self._partition_pool is None:
+                    self._partition_pool = ProcessPoolExecutor(max_workers=self.partition_workers)
+                pool = self._partition_pool
+            call = (_call_step_partitioned, (pool, partitions, func, inputs, step_args, step_kwargs))
+        else:
+            call = (_call_step, (func, inputs, step_args, step_kwargs))
+        failures: List[BaseException] = []
+        result, metrics, error = measure_call(_call_with_retries, (*call, options, failures), self.trace_memory)
+        record["retries"] = len(failures)
+        if error is None and cache_key is not None:
+            self.cache.set(cache_key, result)
+        return self._end_step(record, result, metrics, error)
     
+    def compile(self, output_path: str, fallback_imports: Optional[List[str]] = None) -> str:
+        """Write the pipeline as a standalone script, with a `main()` running the steps, and return its path.
+
+        Arguments of the steps have to be Python literals. The imports of the functions are resolved
+        with their own modules' imports, then with `fallback_imports` (all imports of the current
+        directory by default).
+        """
+        return PipelineCompiler(fallback_imports).compile_steps(self.steps, output_path)
+
     def show_pipeline_steps(self) -> None:
         """Display the logical flow of the functions in the pipeline."""
         if not self.steps:
@@ -44,13 +502,519 @@ class Pipeline:
             step_kwargs_str = ", ".join(f"{k}={v}" for k, v in step_kwargs.items()) if step_kwargs else ""
             step_params_str = step_args_str + (", " if step_args_str and step_kwargs_str else "") + step_kwargs_str
 
-            print(f"{i}. [{step_category}] {step_name}({step_params_str})")
+            print(f"{i}. [{step_category}] {step_name}({step_params_str}){self._format_step_suffix(i - 1)}")
+
+    def _format_step_suffix(self, index: int) -> str:
+        """Return extra information displayed after a step in show_pipeline_steps."""
+        return ""
             
-    def get_pipeline_steps_json(self) -> str:
+    def get_pipeline_steps_json(self, include_timings: bool = False) -> str:
         
-        """Return the pipeline steps as a JSON string."""
+        """Return the pipeline steps as a JSON string, optionally with the measurements of the last run."""
         steps_data = [
             {"name": step.__name__, "category": step.__category__}
             for step, _, _ in self.steps
         ]
+        if include_timings:
+            self._add_timings(steps_data)
+        return json.dumps(steps_data)
+
+    def _add_timings(self, steps_data: List[Dict[str, Any]]) -> None:
+        # The record of a fused step, or of a reader running pushed-down filters, holds the timings of all its steps
+        records = {
+            position: record
+            for record in (self.last_run_report.steps if self.last_run_report else [])
+            for position in record["positions"]
+        }
+        for index, step_data in enumerate(steps_data):
+            record = records.get(index, {})
+            for field in ["status", "wall_time", "cpu_time", "peak_memory", "output_rows", "output_bytes"]:
+                step_data[field] = record.get(field)
+
+
+def _call_step(func: Callable, inputs: List[Any], args: tuple, kwargs: Dict[str, Any]) -> Any:
+    """Call a step with the outputs of its upstream steps followed by its own arguments."""
+    # A reducer run on the whole dataset is a single chunk, so its result goes through the same combine
+    return _combine_partials(func, [_call_partition(func, inputs, args, kwargs)])
+
+
+def _call_with_retries(func: Callable, args: tuple, options: Dict[str, Any],
+                       failures: Optional[List[BaseException]] = None) -> Any:
+    """Call a step, retrying it with exponential backoff when it fails with one of its `retry_on` exceptions.
+
+    Each attempt is given up after the step's `timeout`, with a TimeoutError which is retried too by default.
+    The errors of the attempts which were retried are appended to `failures`.
+    """
+    retries = options.get("retries", 0)
+    delay = options.get("retry_delay", 1.0)
+    retry_on = options.get("retry_on", (OSError,))
+    for attempt in range(retries + 1):
+        try:
+            return _call_with_timeout(func, args, options.get("timeout"))
+        except retry_on as e:
+            if attempt == retries:
+                raise
+            if failures is not None:
+                failures.append(e)
+            time.sleep(delay)
+            delay *= options.get("backoff", 2.0)
+
+
+async def _call_with_retries_async(func: Callable, args: tuple, options: Dict[str, Any],
+                                   failures: Optional[List[BaseException]] = None) -> Any:
+    """Await an async step, retrying it like _call_with_retries, without blocking the event loop while waiting."""
+    retries = options.get("retries", 0)
+    delay = options.get("retry_delay", 1.0)
+    retry_on = options.get("retry_on", (OSError,))
+    for attempt in range(retries + 1):
+        try:
+            return await _await_with_timeout(func, args, options.get("timeout"))
+        except retry_on as e:
+            if attempt == retries:
+                raise
+            if failures is not None:
+                failures.append(e)
+            await asyncio.sleep(delay)
+            delay *= options.get("backoff", 2.0)
+
+
+async def _await_with_timeout(func: Callable, args: tuple, timeout: Optional[float]) -> Any:
+    """Await a coroutine function, cancelling it with a TimeoutError if it hasn't returned after `timeout` seconds."""
+    try:
+        return await asyncio.wait_for(func(*args), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"The step did not complete within {timeout} seconds.") from None
+
+
+def _call_with_timeout(func: Callable, args: tuple, timeout: Optional[float]) -> Any:
+    """Call a function, raising a TimeoutError if it hasn't returned after `timeout` seconds.
+
+    A thread cannot be stopped, so a call which timed out keeps running in the background until it returns.
+    """
+    if timeout is None:
+        return func(*args)
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        return pool.submit(func, *args).result(timeout=timeout)
+    except FuturesTimeoutError:
+        raise TimeoutError(f"The step did not complete within {timeout} seconds.") from None
+    finally:
+        pool.shutdown(wait=False)
+
+
+def _call_partition(func: Callable, inputs: List[Any], args: tuple, kwargs: Dict[str, Any]) -> Any:
+    """Call a step on its inputs, or on a partition of its first input, without combining the result."""
+    inputs = [_resolve(data) for data in inputs]
+    result = func(*inputs, *args, **kwargs)
+    if inspect.iscoroutine(result):
+        # An async step run outside of execute_async
+        result = asyncio.run(result)
+    return _apply_fuse(func, inputs, result)
+
+
+def _apply_fuse(func: Callable, inputs: List[Any], result: Any) -> Any:
+    """Apply the row mask or columns returned by a step registered with `fuse` to its input."""
+    fuse = CategoryRegister.get_step_options(func).get("fuse")
+    return FusedStep.apply(fuse, inputs[0], result) if fuse is not None else result
+
+
+def _combine_partials(func: Callable, partials: List[Any]) -> Any:
+    """Combine the results of a reducer step computed on parts of its input. Other steps have a single part."""
+    combine = CategoryRegister.get_step_options(func).get("combine")
+    return combine(partials) if combine is not None else partials[0]
+
+
+def _call_step_partitioned(pool: Executor, partitions: int, func: Callable, inputs: List[Any], args: tuple,
+                           kwargs: Dict[str, Any]) -> Any:
+    """Call a step on row partitions of its first input across a pool and concatenate the results in order.
+
+    Reducers combine the partial results of the partitions instead.
+    """
+    import pandas as pd
+
+    data = _resolve(inputs[0])
+    bounds = [len(data) * part // partitions for part in range(partitions + 1)]
+    futures = [
+        pool.submit(_call_partition, func, [data.iloc[start:stop]] + inputs[1:], args, kwargs)
+        for start, stop in zip(bounds, bounds[1:])
+    ]
+    results = [future.result() for future in futures]
+    if CategoryRegister.get_step_options(func).get("combine") is not None:
+        return _combine_partials(func, results)
+    return pd.concat(results)
+
+
+def _call_step_columnar(directory: str, key: str, func: Callable, inputs: List[Any], args: tuple,
+                        kwargs: Dict[str, Any]) -> Any:
+    """Call a step and, if it returns a DataFrame, store it in a ColumnarStore and return a reference to it."""
+    result = _call_step(func, inputs, args, kwargs)
+    if ColumnarStore.supports(result):
+        return ColumnarStore(directory).write(key, result)
+    return result
+
+
+def _resolve(data: Any, mmap: bool = True) -> Any:
+    """Load the value behind a ColumnarRef or SpilledRef, or return any other value as is."""
+    return data.load(mmap) if isinstance(data, (ColumnarRef, SpilledRef)) else data
+
+
+def _execute_steps(steps: List[tuple]) -> Any:
+    """Run the steps of a sequential pipeline, without a cache, hooks or a run report."""
+    data = None
+    for step, step_args, step_kwargs in steps:
+        call = (step, [] if data is None else [data], step_args, step_kwargs)
+        data = _call_with_retries(_call_step, call, CategoryRegister.get_step_options(step))
+    return data
+
+
+def _execute_graph(steps: List[tuple], step_names: List[str], dependencies: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Run the steps of a DAG pipeline one at a time, in the order they were added, without a cache, hooks or a
+    run report. Returns the outputs of the final steps by name."""
+    pending_consumers: Dict[str, int] = {name: 0 for name in step_names}
+    for upstream_steps in dependencies.values():
+        for upstream in set(upstream_steps):
+            pending_consumers[upstream] += 1
+    results: Dict[str, Any] = {}
+    for name, (step, step_args, step_kwargs) in zip(step_names, steps):
+        call = (step, [results[upstream] for upstream in dependencies[name]], step_args, step_kwargs)
+        results[name] = _call_with_retries(_call_step, call, CategoryRegister.get_step_options(step))
+        for upstream in set(dependencies[name]):
+            pending_consumers[upstream] -= 1
+            if pending_consumers[upstream] == 0:
+                del results[upstream]
+    return results
+
+
+def _execute_runs(runs: List[Callable]) -> List[Any]:
+    """Run a chunk of map runs in a worker."""
+    return [run() for run in runs]
+
+
+async def _call_step_async(func: Callable, inputs: List[Any], args: tuple, kwargs: Dict[str, Any]) -> Any:
+    """Await an async step with the outputs of its upstream steps followed by its own arguments."""
+    inputs = [_resolve(data) for data in inputs]
+    result = await func(*inputs, *args, **kwargs)
+    return _combine_partials(func, [_apply_fuse(func, inputs, result)])
+
+
+def _reduce_chunks(func: Callable, chunks: Iterator, args: tuple, kwargs: Dict[str, Any]) -> Any:
+    """Apply a reducer step to every chunk of a stream and combine the partial results."""
+    partials = [func(chunk, *args, **kwargs) for chunk in chunks]
+    return CategoryRegister.get_step_options(func)["combine"](partials)
+
+
+def _sum_known(values: List[Optional[int]]) -> Optional[int]:
+    known = [value for value in values if value is not None]
+    return sum(known) if known else None
+
+
+def _iter_chunks(data: Any) -> Iterator:
+    """Return the chunks of a reader's output. Anything other than an iterator is a single chunk."""
+    return data if isinstance(data, Iterator) else iter([data])
+
+
+def _map_chunks(func: Callable, chunks: Iterator, args: tuple, kwargs: Dict[str, Any]) -> Iterator:
+    """Lazily apply a step to every chunk of a stream."""
+    for chunk in chunks:
+        yield _call_step(func, [chunk], args, kwargs)
+
+
+class DAGPipeline(Pipeline):
+    """A pipeline whose steps declare the upstream steps they consume.
+
+    Steps are started as soon as all of their inputs are available, so independent
+    branches (e.g. several data_reader steps) run concurrently on a thread or process pool, or on
+    any Executor given as `executor`, e.g. a DistributedExecutor.
+
+    With the process executor and columnar=True, DataFrames produced by the workers are written
+    once to a ColumnarStore in the project directory. They are handed to other workers by
+    reference and memory-mapped, instead of being pickled for every consumer.
+
+    The output of a step is released as soon as the last step consuming it has run. With a
+    memory_budget in bytes, the largest outputs still needed are spilled to disk whenever the
+    outputs held in memory exceed it, and read back when their consumers run.
+    """
+
+    def __init__(self, flow_pilot: FlowPilot, executor: Union[str, Executor] = "thread", max_workers: Optional[int] = None,
+                 cache: Union[bool, StepCache] = False, columnar: bool = False, memory_budget: Optional[int] = None):
+        super().__init__(flow_pilot, cache)
+        if not isinstance(executor, Executor) and executor not in ["thread", "process"]:
+            raise ValueError("Invalid executor. It should be one of 'thread', 'process' or an Executor.")
+        self.executor = executor
+        self.max_workers = max_workers
+        self.columnar = columnar and executor == "process"
+        self.memory_budget = memory_budget
+        self.step_names: List[str] = []
+        self.dependencies: Dict[str, List[str]] = {}
+
+    def add_step(self, category: str, func: Callable, *args, step_name: Optional[str] = None,
+                 depends_on: Optional[List[str]] = None, **kwargs) -> str:
+        """Add a step consuming the outputs of `depends_on`, in order, as its leading arguments."""
+        self._validate_function_category(func, category)
+        step_name = step_name or func.__name__
+        if step_name in self.dependencies:
+            raise ValueError(f"Step '{step_name}' already exists in the pipeline.")
+        depends_on = list(depends_on or [])
+        for upstream in depends_on:
+            if upstream not in self.dependencies:
+                raise ValueError(f"Step '{step_name}' depends on unknown step '{upstream}'.")
+
+        self.steps.append((func, args, kwargs))
+        self.step_names.append(step_name)
+        self.dependencies[step_name] = depends_on
+        return step_name
+
+    def compile(self, output_path: str, fallback_imports: Optional[List[str]] = None) -> str:
+        """Write the pipeline as a standalone script running the steps one at a time, in the order they were added.
+
+        `main()` returns the outputs of the final steps by name, like execute.
+        """
+        return PipelineCompiler(fallback_imports).compile_graph(self.steps, self.step_names, self.dependencies,
+                                                                output_path)
+
+    def _measures_peak_rss(self) -> bool:
+        return self.trace_memory or self.memory_budget is not None
+
+    def _get_consumers(self) -> Dict[str, List[str]]:
+        """Map each step name to the names of the steps consuming its output."""
+        consumers: Dict[str, List[str]] = {name: [] for name in self.step_names}
+        for name, upstream_steps in self.dependencies.items():
+            for upstream in set(upstream_steps):
+                consumers[upstream].append(name)
+        return consumers
+
+    def execute(self) -> Dict[str, Any]:
+        """Execute the steps in dependency order and return the outputs of the final steps by name."""
+        steps = dict(zip(self.step_names, self.steps))
+        indexes = {name: index for index, name in enumerate(self.step_names)}
+        consumers = self._get_consumers()
+        pending_inputs = {name: len(set(upstream)) for name, upstream in self.dependencies.items()}
+        ready = [name for name in self.step_names if pending_inputs[name] == 0]
+        pending_consumers = {name: len(consumers[name]) for name in self.step_names}
+        results: Dict[str, Any] = {}
+
+        budget = None
+        if self.memory_budget is not None:
+            budget = MemoryBudget(self.memory_budget, self.flow_pilot.project.get_internal_directory("spill", uuid.uuid4().hex))
+
+        def complete(name: str, result: Any) -> None:
+            results[name] = result
+            for upstream in set(self.dependencies[name]):
+                pending_consumers[upstream] -= 1
+                if pending_consumers[upstream] == 0:
+                    # Every consumer has run, so the output of the upstream step is no longer needed
+                    del results[upstream]
+                    if budget is not None:
+                        budget.release(upstream)
+            if budget is not None:
+                budget.track(name, result)
+                self.last_run_report.spilled.extend(budget.enforce(results))
+            for consumer in consumers[name]:
+                pending_inputs[consumer] -= 1
+                if pending_inputs[consumer] == 0:
+                    ready.append(consumer)
+
+        store_directory = None
+        if self.columnar:
+            store_directory = self.flow_pilot.project.get_internal_directory("columnar", uuid.uuid4().hex)
+
+        started_tracing = self._begin_run()
+        if isinstance(self.executor, Executor):
+            # An executor given to the pipeline, e.g. a DistributedExecutor, is left running
+            pool_context = contextlib.nullcontext(self.executor)
+        else:
+            pool_class = ThreadPoolExecutor if self.executor == "thread" else ProcessPoolExecutor
+            pool_context = pool_class(max_workers=self.max_workers)
+        try:
+            with pool_context as pool:
+                running = {}
+                while ready or running:
+                    while ready:
+                        name = ready.pop(0)
+                        func, step_args, step_kwargs = steps[name]
+                        inputs = [results[upstream] for upstream in self.dependencies[name]]
+                        record = self._begin_step(indexes[name], name, func, inputs)
+                        cache_key = self._get_cache_key(func, [_resolve(data) for data in inputs], step_args, step_kwargs)
+                        if cache_key is not None:
+                            hit, result = self.cache.get(cache_key)
+                            if hit:
+                                complete(name, self._end_step(record, result, status="cached"))
+                                continue
+                        if store_directory is not None:
+                            call = (_call_step_columnar, (store_directory, name, func, inputs, step_args, step_kwargs))
+                        else:
+                            call = (_call_step, (func, inputs, step_args, step_kwargs))
+                        options = CategoryRegister.get_step_options(func)
+                        future = pool.submit(measure_call, _call_with_retries, (*call, options), self.trace_memory)
+                        running[future] = (name, record, cache_key)
+
+                    if not running:
+                        break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name, record, cache_key = running.pop(future)
+                        result, metrics, error = future.result()
+                        if error is None and cache_key is not None:
+                            self.cache.set(cache_key, _resolve(result))
+                        complete(name, self._end_step(record, result, metrics, error))
+
+            # Load the final outputs fully, as the store of this run is removed
+            return {name: _resolve(results[name], mmap=False) for name in self.step_names if not consumers[name]}
+        finally:
+            self._end_run(started_tracing)
+            if store_directory is not None:
+                shutil.rmtree(store_directory, ignore_errors=True)
+            if budget is not None:
+                budget.cleanup()
+
+    async def execute_async(self, max_concurrency: Optional[int] = None, semaphore: Optional[asyncio.Semaphore] = None,
+                            executor: Optional[Executor] = None) -> Dict[str, Any]:
+        """Execute the steps on the running event loop, running independent branches concurrently.
+
+        Takes the same arguments as Pipeline.execute_async and returns the outputs of the final steps by name.
+        """
+        semaphore = semaphore or (asyncio.Semaphore(max_concurrency) if max_concurrency else None)
+        steps = dict(zip(self.step_names, self.steps))
+        consumers = self._get_consumers()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run(index: int, name: str) -> Any:
+            inputs = [await tasks[upstream] for upstream in self.dependencies[name]]
+            func, step_args, step_kwargs = steps[name]
+            return await self._run_step_async(func, inputs, step_args, step_kwargs, index, name, semaphore, executor)
+
+        started_tracing = self._begin_run()
+        try:
+            # Steps are added after their dependencies, so every upstream task exists when a step is scheduled
+            for index, name in enumerate(self.step_names):
+                tasks[name] = asyncio.ensure_future(run(index, name))
+            try:
+                await asyncio.gather(*tasks.values())
+            except BaseException:
+                for task in tasks.values():
+                    task.cancel()
+                raise
+        finally:
+            self._end_run(started_tracing)
+
+        return {name: tasks[name].result() for name in self.step_names if not consumers[name]}
+
+    def _bind_run(self, run: Any) -> Callable:
+        """Return a picklable callable executing a single map run in a worker.
+
+        Within a run, the steps are executed one at a time, in the order they were added, and the outputs of the
+        final steps are returned by name, like execute.
+        """
+        return partial(_execute_graph, self._bind_steps(run), list(self.step_names), dict(self.dependencies))
+
+    def _get_step_positions(self) -> Dict[str, int]:
+        return {name: index for index, name in enumerate(self.step_names)}
+
+    def _format_step_suffix(self, index: int) -> str:
+        upstream_steps = self.dependencies[self.step_names[index]]
+        return f" <- {', '.join(upstream_steps)}" if upstream_steps else ""
+
+    def get_pipeline_steps_json(self, include_timings: bool = False) -> str:
+        """Return the pipeline steps, including their step names and dependencies, as a JSON string."""
+        steps_data = [
+            {
+                "name": step.__name__,
+                "category": step.__category__,
+                "step_name": step_name,
+                "depends_on": self.dependencies[step_name],
+            }
+            for step_name, (step, _, _) in zip(self.step_names, self.steps)
+        ]
+        if include_timings:
+            self._add_timings(steps_data)
         return json.dumps(steps_data)
+
+
+class PipelineGroup:
+    """Pipelines executed together, running the steps their prefixes share once.
+
+    The steps of the pipelines are merged into a tree: steps with the same function and the same args and kwargs,
+    preceded by the same steps, are a single node. Each node runs once and its output is passed to every branch
+    below it. It is released as soon as the last of these branches has consumed it, unless it is the result of
+    one of the pipelines. Branches share the same output objects, so steps must not modify their input in place.
+
+    Only sequential pipelines can be grouped. The group's own cache, hooks and run report are used. A step index
+    in the run report is the step's depth in the tree.
+    """
+
+    def __init__(self, flow_pilot: FlowPilot, pipelines: Iterable[Pipeline], cache: Union[bool, StepCache] = False,
+                 trace_memory: bool = False):
+        self.pipelines = list(pipelines)
+        for pipeline in self.pipelines:
+            if isinstance(pipeline, DAGPipeline) or not isinstance(pipeline, Pipeline):
+                raise ValueError("A PipelineGroup can only group sequential Pipelines.")
+        # Runs the nodes of the tree, holding the group's cache, hooks and run report
+        self.runner = Pipeline(flow_pilot, cache, trace_memory)
+
+    @property
+    def cache(self) -> Optional[StepCache]:
+        return self.runner.cache
+
+    @property
+    def last_run_report(self) -> Optional[RunReport]:
+        return self.runner.last_run_report
+
+    def add_hook(self, event: str, callback: Callable) -> None:
+        """Register a callback for a step event, see Pipeline.add_hook."""
+        self.runner.add_hook(event, callback)
+
+    @staticmethod
+    def _get_step_key(step: tuple) -> Any:
+        """Return what identifies a step in the tree. Steps whose arguments can't be fingerprinted are never shared."""
+        func, step_args, step_kwargs = step
+        fingerprint = StepCache.fingerprint((step_args, sorted(step_kwargs.items(), key=lambda item: item[0])))
+        return (id(func), fingerprint) if fingerprint is not None else object()
+
+    def build_tree(self) -> Dict[str, Any]:
+        """Merge the steps of the pipelines into a tree of nodes, each with its step, children and the
+        positions of the pipelines ending at it."""
+        root: Dict[str, Any] = {"step": None, "children": {}, "pipelines": []}
+        for position, pipeline in enumerate(self.pipelines):
+            node = root
+            for step in PushdownPlanner.plan(pipeline.steps):
+                node = node["children"].setdefault(
+                    self._get_step_key(step), {"step": step, "children": {}, "pipelines": []}
+                )
+            node["pipelines"].append(position)
+        return root
+
+    def get_step_counts(self) -> Dict[str, int]:
+        """Return the number of steps of the pipelines and the number of steps the group actually runs."""
+        def count_nodes(node: Dict[str, Any]) -> int:
+            return sum(1 + count_nodes(child) for child in node["children"].values())
+
+        return {
+            "steps": sum(len(PushdownPlanner.plan(pipeline.steps)) for pipeline in self.pipelines),
+            "executed_steps": count_nodes(self.build_tree()),
+        }
+
+    def execute(self) -> List[Any]:
+        """Execute every pipeline and return their results, in the order of the pipelines."""
+        results: List[Any] = [None] * len(self.pipelines)
+        root = self.build_tree()
+        started_tracing = self.runner._begin_run()
+        try:
+            self._execute_children(root, [], 0, results)
+        finally:
+            self.runner._end_run(started_tracing)
+        return results
+
+    def _execute_children(self, node: Dict[str, Any], inputs: List[Any], depth: int, results: List[Any]) -> None:
+        """Run the subtrees below a node on its output, held in `inputs`, which is emptied once every child ran."""
+        children = list(node["children"].values())
+        for number, child in enumerate(children):
+            func, step_args, step_kwargs = child["step"]
+            output = self.runner._run_step(func, list(inputs), step_args, step_kwargs, depth)
+            if number == len(children) - 1:
+                # Every branch has consumed the output of the node, so it is released before descending further
+                inputs.clear()
+            for position in child["pipelines"]:
+                results[position] = output
+            child_inputs = [output]
+            del output
+            self._execute_children(child, child_inputs, depth + 1, results)
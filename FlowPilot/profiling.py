@@ -0,0 +1,174 @@
+import sys
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+
+def data_size(data: Any, deep: bool = False, count_bytes: bool = True) -> Tuple[Optional[int], Optional[int]]:
+    """Return the number of rows and bytes of a step's data, None when they are not known.
+
+    With count_bytes=False, the bytes of DataFrames and Series, which are summed column by column, are not counted.
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+
+    if pd is not None and isinstance(data, (pd.DataFrame, pd.Series)):
+        if not count_bytes:
+            return len(data), None
+        memory_usage = data.memory_usage(index=True, deep=deep)
+        return len(data), int(memory_usage.sum() if isinstance(data, pd.DataFrame) else memory_usage)
+    if hasattr(data, "nbytes") and hasattr(data, "shape"):
+        return (data.shape[0] if data.shape else 1), int(data.nbytes)
+    if isinstance(data, (list, tuple, dict, set)):
+        return len(data), None
+    return None, None
+
+
+def measure_call(func: Callable, args: tuple, trace_memory: bool = False) -> Tuple[Any, Dict[str, Any], Optional[BaseException]]:
+    """Call a function and measure its wall time, CPU time and, optionally, its peak memory delta.
+
+    Exceptions are returned instead of raised so that the measurements of failed calls are kept.
+    The CPU time is that of the calling thread and the memory delta covers the Python allocations
+    traced by tracemalloc, in the whole process, while the function runs.
+    """
+    started_tracing = False
+    if trace_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+
+    result, error = None, None
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        result = func(*args)
+    except Exception as e:
+        error = e
+    metrics = {
+        "wall_time": time.perf_counter() - wall_start,
+        "cpu_time": time.thread_time() - cpu_start,
+        "peak_memory": None,
+    }
+
+    if trace_memory:
+        metrics["peak_memory"] = tracemalloc.get_traced_memory()[1] - memory_before
+        if started_tracing:
+            tracemalloc.stop()
+    return result, metrics, error
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak resident memory of the process, which only Linux supports. Returns whether it was reset."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss() -> Optional[int]:
+    """Return the peak resident memory of the process in bytes, None when the platform doesn't report it.
+
+    This is the peak since the last reset_peak_rss, or since the process started where it can't be reset.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def measure_call_async(func: Callable, args: tuple) -> Tuple[Any, Dict[str, Any], Optional[BaseException]]:
+    """Await a coroutine function and measure its wall time.
+
+    The CPU time is not recorded (None) because other tasks run on the same thread while the call is suspended.
+    """
+    result, error = None, None
+    wall_start = time.perf_counter()
+    try:
+        result = await func(*args)
+    except Exception as e:
+        error = e
+    return result, {"wall_time": time.perf_counter() - wall_start, "cpu_time": None, "peak_memory": None}, error
+
+
+class RunReport:
+    """Structured report of a pipeline run, with one record per executed step.
+
+    With measure_peak_rss=True, `peak_rss` is set to the peak resident memory when the run finishes. It is
+    that of the whole process since the last reset_peak_rss, so it includes any run executing concurrently.
+    """
+
+    def __init__(self, measure_peak_rss: bool = False):
+        self.started_at = time.time()
+        self.wall_time: Optional[float] = None
+        self.steps: List[Dict[str, Any]] = []
+        self.measure_peak_rss = measure_peak_rss
+        self.peak_rss: Optional[int] = None
+        self.spilled: List[str] = []
+        self._start = time.perf_counter()
+
+    def add_step(self, record: Dict[str, Any]) -> None:
+        self.steps.append(record)
+
+    def finish(self) -> None:
+        self.wall_time = time.perf_counter() - self._start
+        if self.measure_peak_rss:
+            self.peak_rss = get_peak_rss()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at,
+            "wall_time": self.wall_time,
+            "peak_rss": self.peak_rss,
+            "spilled": self.spilled,
+            "steps": self.steps,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), default=str)
+
+    def show(self) -> None:
+        """Print one line per step with its status and timings."""
+        for record in self.steps:
+            cpu_time = f", cpu {record['cpu_time']:.4f}s" if record.get("cpu_time") is not None else ""
+            peak_memory = f", peak memory {record['peak_memory']} B" if record.get("peak_memory") is not None else ""
+            print(
+                f"{record['index'] + 1}. [{record['category']}] {record['step_name']}: {record['status']}, "
+                f"wall {record['wall_time']:.4f}s{cpu_time}{peak_memory}"
+            )
+        if self.peak_rss is not None:
+            print(f"Peak resident memory: {self.peak_rss} B")
+        if self.spilled:
+            print(f"Spilled to disk: {', '.join(self.spilled)}")
+
+
+class JsonLinesHook:
+    """Pipeline hook appending each step record to a JSON lines file.
+
+    Register it for both the after_step and on_error events:
+        hook = JsonLinesHook("metrics.jsonl")
+        pipeline.add_hook("after_step", hook)
+        pipeline.add_hook("on_error", hook)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, record: Dict[str, Any], error: Optional[BaseException] = None) -> None:
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
@@ -15,6 +15,12 @@ class Project:
         """Create the project directory."""
         if not os.path.exists(self.project_name):
             os.makedirs(self.project_name)
+
+    def get_internal_directory(self, *parts: str) -> str:
+        """Return a directory for FlowPilot's own files inside the project directory, creating it if needed."""
+        path = os.path.join(self.project_name, ".flowpilot", *parts)
+        os.makedirs(path, exist_ok=True)
+        return path
             
     def _generate_function_docstring(self, func: Callable, comment: Optional[str] = None) -> str:
         signature = inspect.signature(func)
@@ -41,13 +47,3 @@ class Project:
         indented_docstring = "\n".join([indent + line for line in docstring_lines])
 
         return indented_docstring
-
-    @staticmethod
-    def _remove_decorator(func_str: str) -> str:
-        """Remove the decorator from the function source code."""
-        pattern = r"@\w+\.[a-z_]+\(.+?\)\n"
-        match = re.search(pattern, func_str)
-        if match:
-            func_str = func_str[: match.start()] + func_str[match.end() :]
-        return func_str
-    
\ No newline at end of file
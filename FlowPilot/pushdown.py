@@ -0,0 +1,86 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from cache import *
+
+
+class RowPredicate:
+    """Row filters of a pipeline pushed down to its reader.
+
+    Calling it on a DataFrame, or on a chunk of one, returns the mask of the rows every filter keeps.
+    """
+
+    def __init__(self, steps: List[tuple]):
+        self.steps = steps
+        # Part of the pickled state, so that incremental runs see when a filter's code changes
+        self.source = "\n".join(
+            StepCache.function_source(func) + StepCache.code_fingerprint(func) for func, _, _ in steps
+        )
+
+    def __call__(self, data: Any) -> Any:
+        mask = None
+        for func, step_args, step_kwargs in self.steps:
+            step_mask = func(data, *step_args, **step_kwargs)
+            mask = step_mask if mask is None else mask & step_mask
+        return mask
+
+    def __repr__(self) -> str:
+        return f"<RowPredicate {', '.join(func.__name__ for func, _, _ in self.steps)}>"
+
+
+class PushdownPlanner:
+    """Push the columns and row filters used by a pipeline's transformers down to a reader registered with pushdown=True.
+
+    The reader receives two keyword arguments:
+        columns:   the columns read by the steps after it, or None when they are not known, see get_columns.
+        predicate: a RowPredicate combining the `fuse="filter"` transformers directly after the reader, or None.
+                   These filters are not run again after the reader.
+    """
+
+    @staticmethod
+    def get_step_options(func: Callable) -> Dict[str, Any]:
+        return getattr(func, "__step_options__", {})
+
+    @classmethod
+    def get_columns(cls, steps: List[tuple]) -> Optional[List[str]]:
+        """Return the columns the steps after the reader read, None if the reader has to read every column.
+
+        Only the output of a reducer (a step with a `combine` option) or of a data_writer can't carry the
+        reader's frame, with all of its columns, to the pipeline's output. Otherwise every column is read.
+        Every step also has to declare its columns, and none may be registered with fuse="assign": the
+        columns it adds can't be told apart from those of the reader, which doesn't have them.
+        """
+        if not steps:
+            return None
+        last_step = steps[-1][0]
+        if cls.get_step_options(last_step).get("combine") is None and last_step.__category__ != "data_writer":
+            return None
+        columns = set()
+        for func, _, _ in steps:
+            options = cls.get_step_options(func)
+            if options.get("columns") is None or options.get("fuse") == "assign":
+                return None
+            columns.update(options["columns"])
+        return sorted(columns)
+
+    @classmethod
+    def plan(cls, steps: List[tuple]) -> List[tuple]:
+        """Return the steps to run, with the columns and filters bound to the reader when it opts in."""
+        if not steps or not cls.get_step_options(steps[0][0]).get("pushdown"):
+            return steps
+        reader, reader_args, reader_kwargs = steps[0]
+        later_steps = steps[1:]
+
+        filter_count = 0
+        for func, _, _ in later_steps:
+            if func.__category__ != "data_transformer" or cls.get_step_options(func).get("fuse") != "filter":
+                break
+            filter_count += 1
+        filters = later_steps[:filter_count]
+
+        # Arguments given to the reader step explicitly take precedence
+        pushed_kwargs = {
+            "columns": cls.get_columns(later_steps),
+            "predicate": RowPredicate(filters) if filters else None,
+        }
+        reader_kwargs = {**pushed_kwargs, **reader_kwargs}
+        return [(reader, reader_args, reader_kwargs)] + later_steps[filter_count:]
@@ -0,0 +1,99 @@
+import json
+import inspect
+import importlib
+from typing import Callable, Dict, List, Optional, Any
+
+from function_source import *
+from atomic_file import *
+
+
+class LazyFunction:
+    """Stand-in for a function loaded from the registry index.
+
+    It carries everything needed to search, display and export the function. The defining
+    module is only imported when the function is called (or its step options are needed).
+    """
+
+    def __init__(self, entry: Dict[str, Any]):
+        self._entry = entry
+        self._function: Optional[Callable] = None
+        self.__name__ = entry["name"]
+        # Indexes written before namespaces existed register functions under their own name
+        self.__registered_name__ = entry.get("registered_name", entry["name"])
+        self.__qualname__ = entry["qualname"]
+        self.__module__ = entry["module"]
+        self.__category__ = entry["category"]
+        self.__comment__ = entry["comment"]
+        self.__source__ = entry["source"]
+        self.__clean_source__ = entry["clean_source"]
+        self.__source_file__ = entry["file"]
+        self.__signature_text__ = entry["signature"]
+
+    def load(self) -> Callable:
+        """Import the defining module and return the actual function."""
+        if self._function is None:
+            if self.__module__ == "__main__":
+                raise ImportError(f"Function '{self.__name__}' was defined in __main__ and cannot be imported.")
+            target = importlib.import_module(self.__module__)
+            for attribute in self.__qualname__.split("."):
+                target = getattr(target, attribute)
+            self._function = target
+        return self._function
+
+    @property
+    def __step_options__(self) -> Dict[str, Any]:
+        return getattr(self.load(), "__step_options__", {})
+
+    def __call__(self, *args, **kwargs) -> Any:
+        return self.load()(*args, **kwargs)
+
+    def __reduce__(self):
+        # Workers receive the index entry and import the function themselves
+        return LazyFunction, (self._entry,)
+
+    def __repr__(self) -> str:
+        return f"<LazyFunction {self.__module__}.{self.__qualname__}>"
+
+
+class RegistryIndex:
+    """Compact on-disk index of the registered functions, stored in the project directory."""
+
+    FILE_NAME = "registry.json"
+
+    @staticmethod
+    def describe(category: str, comment: Optional[str], func: Callable, registered_name: Optional[str] = None) -> Dict[str, Any]:
+        """Return the index entry of a registered function."""
+        try:
+            signature = str(inspect.signature(func))
+        except (TypeError, ValueError):
+            signature = getattr(func, "__signature_text__", "(...)")
+        return {
+            "name": func.__name__,
+            "registered_name": registered_name or func.__name__,
+            "category": category,
+            "comment": comment,
+            "module": func.__module__,
+            "qualname": func.__qualname__,
+            "signature": signature,
+            "source": FunctionSource.get_source(func),
+            "clean_source": FunctionSource.get_clean_source(func),
+            "file": FunctionSource.get_source_file(func),
+            "lineno": getattr(getattr(func, "__code__", None), "co_firstlineno", None),
+        }
+
+    @classmethod
+    def save(cls, functions: Dict[str, Dict[str, Dict[str, Any]]], path: str) -> None:
+        """Write the index of the registered functions, grouped by category, to a file atomically."""
+        entries = [
+            cls.describe(category, func_data["comment"], func_data["function"], func_name)
+            for category, category_functions in functions.items()
+            for func_name, func_data in category_functions.items()
+        ]
+        write_atomically(path, json.dumps({"version": 1, "functions": entries}, separators=(",", ":")))
+
+    @staticmethod
+    def load(path: str) -> List[LazyFunction]:
+        """Read an index file and return a lazily imported function per entry."""
+        with open(path) as f:
+            index = json.load(f)
+        return [LazyFunction(entry) for entry in index["functions"]]
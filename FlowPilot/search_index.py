@@ -0,0 +1,171 @@
+import re
+import bisect
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Set, Tuple, Any
+
+from function_source import *
+
+EntryKey = Tuple[str, str]
+
+
+class SearchIndex:
+    """Incrementally maintained index over the registered functions.
+
+    Lowercased names, categories and comments are computed once at registration. Exact and
+    prefix lookups use a hash map and a sorted list, and full-text search uses an inverted
+    index of the comment tokens. Function sources are tokenized lazily, the first time a
+    full-text search includes them.
+    """
+
+    TOKEN_PATTERN = re.compile(r"\w+")
+
+    def __init__(self):
+        self._entries: Dict[EntryKey, Dict[str, Any]] = {}
+        self._exact: Dict[str, Dict[str, Set[EntryKey]]] = {"name": {}, "category": {}}
+        self._sorted: Dict[str, List[Tuple[str, EntryKey]]] = {"name": [], "category": []}
+        self._tokens: Dict[str, Set[EntryKey]] = {}
+        self._source_tokens: Dict[str, Set[EntryKey]] = {}
+        self._registrations = 0
+
+    def add(self, category: str, name: str, comment: Optional[str], func: Callable) -> None:
+        """Add a function to the index, replacing any previous entry for the same category and name."""
+        key = (category, name)
+        previous = self._entries.get(key)
+        if previous is not None:
+            self._unindex(key, previous)
+        entry = self._index_entry(key, comment, func, previous)
+        for field in ["name", "category"]:
+            bisect.insort(self._sorted[field], (entry["lower"][field], key))
+
+    def add_many(self, entries: List[Tuple[str, str, Optional[str], Callable]]) -> None:
+        """Add many (category, name, comment, function) entries, sorting the prefix lists once instead of per entry."""
+        new_keys = []
+        # The last entry for a key wins, as if they were added one by one
+        for category, name, comment, func in {(entry[0], entry[1]): entry for entry in entries}.values():
+            key = (category, name)
+            if key in self._entries:
+                self.add(category, name, comment, func)
+            else:
+                self._index_entry(key, comment, func, None)
+                new_keys.append(key)
+        for field in ["name", "category"]:
+            self._sorted[field].extend((self._entries[key]["lower"][field], key) for key in new_keys)
+            self._sorted[field].sort()
+
+    def _index_entry(self, key: EntryKey, comment: Optional[str], func: Callable,
+                     previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Create the entry of a function and add it to every index but the sorted prefix lists."""
+        category, name = key
+        entry = {
+            "name": name,
+            "category": category,
+            "comment": comment,
+            "function": func,
+            "lower": {"name": name.lower(), "category": category.lower(), "comment": (comment or "").lower()},
+            "tokens": self.tokenize(comment or ""),
+            "source_tokens": None,
+            # Re-registering a function keeps its position, like assigning to an existing dict key
+            "order": previous["order"] if previous is not None else self._registrations,
+        }
+        self._registrations += 1
+        self._entries[key] = entry
+        for field in ["name", "category"]:
+            self._exact[field].setdefault(entry["lower"][field], set()).add(key)
+        for token in entry["tokens"]:
+            self._tokens.setdefault(token, set()).add(key)
+        return entry
+
+    def remove(self, category: str, name: str) -> None:
+        """Remove a function from the index."""
+        key = (category, name)
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._unindex(key, entry)
+
+    def _unindex(self, key: EntryKey, entry: Dict[str, Any]) -> None:
+        for field in ["name", "category"]:
+            value = entry["lower"][field]
+            self._exact[field][value].discard(key)
+            position = bisect.bisect_left(self._sorted[field], (value, key))
+            del self._sorted[field][position]
+        for index, tokens in [(self._tokens, entry["tokens"]), (self._source_tokens, entry["source_tokens"] or [])]:
+            for token in tokens:
+                index[token].discard(key)
+
+    @classmethod
+    def tokenize(cls, text: str) -> Set[str]:
+        return set(cls.TOKEN_PATTERN.findall(text.lower()))
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _compile(pattern: str, case_sensitive: bool) -> "re.Pattern":
+        return re.compile(pattern if case_sensitive else pattern.lower())
+
+    def search(self, search_query: str, search_field: Optional[str] = None, case_sensitive: bool = False) -> List[Dict[str, str]]:
+        """Return the functions whose name, category or comment match a regular expression."""
+        pattern = self._compile(search_query, case_sensitive)
+        fields = ["name", "category", "comment"] if search_field is None else [search_field]
+        # Categories are shared by many functions, so each one is matched once per search
+        category_matches: Dict[str, bool] = {}
+
+        def match(entry: Dict[str, Any], field: str) -> bool:
+            value = entry["lower"][field] if not case_sensitive else (entry[field] or "")
+            if field == "category":
+                if value not in category_matches:
+                    category_matches[value] = bool(pattern.search(value))
+                return category_matches[value]
+            return bool(pattern.search(value))
+
+        return [
+            self._as_result(entry) for entry in self._entries.values()
+            if any(match(entry, field) for field in fields)
+        ]
+
+    def find_exact(self, value: str, search_field: str = "name") -> List[Dict[str, str]]:
+        """Return the functions whose name or category is equal to a value, ignoring case."""
+        keys = self._exact[search_field].get(value.lower(), set())
+        return self._results_for(keys)
+
+    def find_prefix(self, prefix: str, search_field: str = "name") -> List[Dict[str, str]]:
+        """Return the functions whose name or category starts with a prefix, ignoring case."""
+        prefix = prefix.lower()
+        values = self._sorted[search_field]
+        keys = set()
+        for value, key in values[bisect.bisect_left(values, (prefix,)):]:
+            if not value.startswith(prefix):
+                break
+            keys.add(key)
+        return self._results_for(keys)
+
+    def search_text(self, query: str, include_source: bool = True) -> List[Dict[str, str]]:
+        """Return the functions whose comment, or source, contains every token of the query."""
+        if include_source:
+            self._index_sources()
+        matches: Optional[Set[EntryKey]] = None
+        for token in self.tokenize(query):
+            token_matches = set(self._tokens.get(token, set()))
+            if include_source:
+                token_matches |= self._source_tokens.get(token, set())
+            matches = token_matches if matches is None else matches & token_matches
+        return self._results_for(matches or set())
+
+    def _index_sources(self) -> None:
+        for key, entry in self._entries.items():
+            if entry["source_tokens"] is not None:
+                continue
+            try:
+                source = FunctionSource.get_source(entry["function"])
+            except (OSError, TypeError):
+                source = ""
+            entry["source_tokens"] = self.tokenize(source)
+            for token in entry["source_tokens"]:
+                self._source_tokens.setdefault(token, set()).add(key)
+
+    def _results_for(self, keys: Set[EntryKey]) -> List[Dict[str, str]]:
+        # Keep the registration order, like a scan over the registered functions would
+        entries = sorted((self._entries[key] for key in keys), key=lambda entry: entry["order"])
+        return [self._as_result(entry) for entry in entries]
+
+    @staticmethod
+    def _as_result(entry: Dict[str, Any]) -> Dict[str, str]:
+        return {"name": entry["name"], "category": entry["category"], "comment": entry["comment"]}
@@ -0,0 +1,142 @@
+import json
+import time
+import hashlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Any
+
+from category import *
+from function_source import *
+from import_extractor import *
+from atomic_file import *
+
+
+class TestRunner:
+    """Run the functions registered in the `test` category on a process or thread pool.
+
+    A test passes when its function returns without raising. The fingerprint of a test covers its
+    own source and the sources of the registered functions it references, directly or through other
+    registered functions. Tests whose fingerprint is unchanged since they last passed are skipped.
+    """
+
+    # Not a test class, even when imported into a test module
+    __test__ = False
+
+    def __init__(self, category_register: CategoryRegister, state_path: str, category: str = "test",
+                 max_workers: Optional[int] = None, executor: str = "process"):
+        if executor not in ["thread", "process"]:
+            raise ValueError("Invalid executor. It should be one of 'thread' or 'process'.")
+        self.category_register = category_register
+        self.state_path = state_path
+        self.category = category
+        self.max_workers = max_workers
+        self.executor = executor
+
+    def get_tests(self, pattern: Optional[str] = None, search_field: str = "name") -> Dict[str, Callable]:
+        """Return the test functions by registered name, all of them or those matching a search_functions pattern."""
+        tests = self.category_register.get_functions_by_category(self.category)
+        if pattern is None:
+            return {name: func_data["function"] for name, func_data in tests.items()}
+        return {
+            result["name"]: self.category_register.get_function(self.category, result["name"])
+            for result in self.category_register.search_functions(pattern, search_field)
+            if result["category"] == self.category
+        }
+
+    def fingerprint(self, func: Callable, functions_by_name: Dict[str, List[Callable]]) -> str:
+        """Hash the source of a test and of the registered functions it references."""
+        digest = hashlib.sha256()
+        seen = set()
+        pending = [func]
+        while pending:
+            current = pending.pop()
+            source = FunctionSource.get_clean_source(current)
+            digest.update(source.encode())
+            for name in ImportExtractor.referenced_names(source):
+                for referenced in functions_by_name.get(name, []):
+                    if id(referenced) not in seen:
+                        seen.add(id(referenced))
+                        pending.append(referenced)
+        return digest.hexdigest()
+
+    def _functions_by_name(self) -> Dict[str, List[Callable]]:
+        """Map the Python names of the functions registered outside the test category to the functions."""
+        functions_by_name: Dict[str, List[Callable]] = {}
+        for category, category_functions in self.category_register.functions.items():
+            if category == self.category:
+                continue
+            for func_data in category_functions.values():
+                functions_by_name.setdefault(func_data["function"].__name__, []).append(func_data["function"])
+        return functions_by_name
+
+    def load_state(self) -> Dict[str, str]:
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self, state: Dict[str, str]) -> None:
+        write_atomically(self.state_path, json.dumps(state))
+
+    def run(self, pattern: Optional[str] = None, search_field: str = "name", force: bool = False) -> List[Dict[str, Any]]:
+        """Run the tests and return a result per test, with its status ("passed", "failed" or "skipped").
+
+        With force=True, the tests are run even if they haven't changed since they last passed.
+        """
+        tests = self.get_tests(pattern, search_field)
+        functions_by_name = self._functions_by_name()
+        state = self.load_state()
+        fingerprints = {name: self.fingerprint(func, functions_by_name) for name, func in tests.items()}
+
+        results: Dict[str, Dict[str, Any]] = {}
+        to_run = []
+        for name in tests:
+            if not force and state.get(name) == fingerprints[name]:
+                results[name] = {"name": name, "status": "skipped", "wall_time": 0.0, "error": None}
+            else:
+                to_run.append(name)
+
+        pool_class = ThreadPoolExecutor if self.executor == "thread" else ProcessPoolExecutor
+        if to_run:
+            with pool_class(max_workers=self.max_workers) as pool:
+                futures = {name: pool.submit(_run_test, tests[name]) for name in to_run}
+                for name, future in futures.items():
+                    try:
+                        wall_time, error = future.result()
+                    except Exception:
+                        # E.g. a test defined in a function can't be pickled for a worker process
+                        wall_time, error = 0.0, traceback.format_exc()
+                    results[name] = {
+                        "name": name,
+                        "status": "passed" if error is None else "failed",
+                        "wall_time": wall_time,
+                        "error": error,
+                    }
+                    if error is None:
+                        state[name] = fingerprints[name]
+                    else:
+                        state.pop(name, None)
+        self.save_state(state)
+        return [results[name] for name in tests]
+
+    @staticmethod
+    def show(results: List[Dict[str, Any]]) -> None:
+        """Print one line per test and a summary."""
+        for result in results:
+            print(f"{result['name']}: {result['status']} ({result['wall_time']:.4f}s)")
+            if result["error"] is not None:
+                print(result["error"])
+        counts = {status: sum(result["status"] == status for result in results) for status in ["passed", "failed", "skipped"]}
+        print(f"{counts['passed']} passed, {counts['failed']} failed, {counts['skipped']} skipped")
+
+
+def _run_test(func: Callable) -> tuple:
+    """Run a test in a worker, returning its wall time and the formatted error if it failed."""
+    start = time.perf_counter()
+    try:
+        func()
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return time.perf_counter() - start, error
@@ -0,0 +1,234 @@
+"""Benchmarks for the FlowPilot registry, search, export and pipeline execution.
+
+Run every benchmark and print the timings:
+
+    python benchmarks/run_benchmarks.py
+
+Save the timings as a baseline, then compare a later run against it. The comparison uses the
+fastest of the timed runs, which is the least noisy, and exits with status 1 if any benchmark
+got slower than the baseline by more than the tolerance. Benchmarks faster than --min-time are
+too noisy to flag and are only reported:
+
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Put the FlowPilot folder first so that its `pipes` module shadows the standard library one
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "FlowPilot")))
+
+# pipes has to be imported before flowpilot because of the circular import between them
+from pipes import Pipeline
+from flowpilot import FlowPilot
+from category import CategoryRegister
+from import_extractor import ImportExtractor
+
+import pandas as pd
+
+CATEGORIES = ["data_reader", "data_transformer", "data_writer", "test"]
+IMPORT_LINES = [
+    "import os",
+    "import json",
+    "import pandas as pd",
+    "import numpy as np",
+    "from typing import Any, Dict, List",
+    "from collections import defaultdict",
+]
+
+
+def measure(func: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+    """Time `repeat` calls of func, running setup untimed before each call."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat}
+
+
+def write_function_module(directory: str, n_functions: int) -> str:
+    """Write a module of n synthetic functions, so that their source can be read back like real ones."""
+    path = os.path.join(directory, "synthetic_functions.py")
+    with open(path, "w") as file:
+        file.write("\n".join(IMPORT_LINES) + "\n\n")
+        for i in range(n_functions):
+            file.write(
+                f"def {CATEGORIES[i % len(CATEGORIES)]}_step_{i}(df, column='value_{i % 97}'):\n"
+                f"    \"\"\"Synthetic step {i}.\"\"\"\n"
+                f"    return pd.DataFrame(df).assign(**{{column: np.arange(len(df))}})\n\n"
+            )
+    return path
+
+
+def load_module(path: str) -> Any:
+    spec = importlib.util.spec_from_file_location("synthetic_functions", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_registry(functions: List[Callable]) -> CategoryRegister:
+    register = CategoryRegister(list(CATEGORIES))
+    for i, func in enumerate(functions):
+        register.register_function(CATEGORIES[i % len(CATEGORIES)], f"Synthetic step {i} on value_{i % 97}")(func)
+    return register
+
+
+def write_source_tree(directory: str, n_files: int) -> None:
+    """Write a tree of n source files spread over nested packages, each with a handful of imports."""
+    for i in range(n_files):
+        package = os.path.join(directory, f"package_{i % 10}", f"module_{i % 7}")
+        os.makedirs(package, exist_ok=True)
+        with open(os.path.join(package, f"file_{i}.py"), "w") as file:
+            imports = IMPORT_LINES[i % len(IMPORT_LINES):] + [f"import library_{i % 50}"]
+            file.write("\n".join(imports) + "\n\n")
+            file.write(f"def function_{i}():\n    return {i}\n")
+
+
+def bench_registry(results: Dict[str, Dict[str, float]], workdir: str, n_functions: int, repeat: int) -> None:
+    module = load_module(write_function_module(workdir, n_functions))
+    functions = [getattr(module, name) for name in dir(module) if "_step_" in name]
+
+    results[f"register_function[{n_functions}]"] = measure(lambda: make_registry(functions), repeat)
+
+    register = make_registry(functions)
+    results[f"search_functions[{n_functions}]"] = measure(
+        lambda: [register.search_functions(query) for query in ["value_1", "step_99", "Synthetic", "missing"]], repeat
+    )
+
+    def display():
+        with contextlib.redirect_stdout(io.StringIO()):
+            register.display_functions("data_transformer")
+    results[f"display_functions[{n_functions}]"] = measure(display, repeat)
+
+    output_directory = os.path.join(workdir, "exported")
+    os.makedirs(output_directory, exist_ok=True)
+    current_directory = os.getcwd()
+    os.chdir(os.path.join(workdir, "tree"))
+    try:
+        results[f"write_category_to_file[{n_functions}]"] = measure(
+            lambda: register.write_category_to_file("all", output_directory), repeat,
+            setup=ImportExtractor._file_cache.clear,
+        )
+    finally:
+        os.chdir(current_directory)
+
+
+def bench_imports(results: Dict[str, Dict[str, float]], workdir: str, n_files: int, repeat: int) -> None:
+    tree = os.path.join(workdir, f"tree_{n_files}")
+    write_source_tree(tree, n_files)
+    extractor = ImportExtractor()
+    results[f"get_unique_imports_cold[{n_files}]"] = measure(
+        lambda: extractor.get_unique_imports(tree), repeat, setup=ImportExtractor._file_cache.clear
+    )
+    results[f"get_unique_imports_warm[{n_files}]"] = measure(lambda: extractor.get_unique_imports(tree), repeat)
+
+
+def bench_pipeline(results: Dict[str, Dict[str, float]], workdir: str, depth: int, rows: int, repeat: int) -> None:
+    fp = FlowPilot(project_name=os.path.join(workdir, "pipeline_project"))
+
+    @fp.data_reader(comment="Makes a synthetic dataframe")
+    def make_frame(n_rows):
+        return pd.DataFrame({"key": range(n_rows), "value": [float(i % 101) for i in range(n_rows)]})
+
+    @fp.data_transformer(comment="Adds a column derived from the value")
+    def add_column(df, step):
+        return df.assign(**{f"value_{step}": df["value"] * step})
+
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", make_frame, rows)
+    for step in range(depth):
+        pipeline.add_step("data_transformer", add_column, step)
+    results[f"pipeline_execute[depth={depth},rows={rows}]"] = measure(pipeline.execute, repeat)
+
+
+def run_benchmarks(scale: float, repeat: int) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = {}
+    workdir = tempfile.mkdtemp(prefix="flowpilot_bench_")
+    try:
+        for n_files in [int(100 * scale), int(1000 * scale)]:
+            bench_imports(results, workdir, max(n_files, 1), repeat)
+        write_source_tree(os.path.join(workdir, "tree"), max(int(200 * scale), 1))
+        bench_registry(results, workdir, max(int(10000 * scale), len(CATEGORIES)), repeat)
+        for depth, rows in [(5, int(10000 * scale)), (50, int(10000 * scale)), (5, int(1000000 * scale))]:
+            bench_pipeline(results, workdir, depth, max(rows, 1), repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], tolerance: float,
+            min_time: float) -> List[str]:
+    """Print each benchmark against the baseline and return the names of the ones that regressed."""
+    regressions = []
+    for name, timing in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print(f"{name:<50} {timing['min']:>10.4f}s  (new)")
+            continue
+        ratio = timing["min"] / previous["min"] if previous["min"] else 1.0
+        if ratio <= 1 + tolerance:
+            status = "ok"
+        else:
+            status = "REGRESSION" if previous["min"] >= min_time else "slower (below --min-time)"
+        print(f"{name:<50} {timing['min']:>10.4f}s  {ratio:>6.2f}x  {status}")
+        if status == "REGRESSION":
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the registry, tree and data sizes.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs per benchmark.")
+    parser.add_argument("--save", help="Save the results as a JSON baseline at this path.")
+    parser.add_argument("--compare", help="Compare the results against the JSON baseline at this path.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown before it counts as a regression (0.2 = 20%%).")
+    parser.add_argument("--min-time", type=float, default=0.005,
+                        help="Benchmarks whose baseline is faster than this many seconds are never flagged.")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scale, args.repeat)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "scale": args.scale,
+                "results": results,
+            }, file, indent=4)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline.get("scale") != args.scale:
+            print(f"Warning: the baseline was run with --scale {baseline.get('scale')}.")
+        regressions = compare(results, baseline, args.tolerance, args.min_time)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}.")
+            return 1
+        return 0
+
+    for name, timing in results.items():
+        print(f"{name:<50} {timing['min']:>10.4f}s  (median {timing['median']:.4f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "FlowPilot")))
+
+from category import CategoryRegister
+
+
+def make_register():
+    register = CategoryRegister(["data_reader", "data_transformer"])
+
+    @register.register_function("data_reader", comment="Reads the Titanic CSV")
+    def read_titanic(path):
+        return path
+
+    @register.register_function("data_transformer", comment="Calculates avg. age by survival")
+    def get_survivor_age(df):
+        return df.groupby("Survived")["Age"].mean()
+
+    @register.register_function("data_transformer", comment="Calculates avg. fare by survival")
+    def get_survivor_fare(df):
+        return df
+
+    return register
+
+
+def test_search_functions_matches_regex_case_insensitively():
+    register = make_register()
+    results = register.search_functions("calc*")
+    assert [result["name"] for result in results] == ["get_survivor_age", "get_survivor_fare"]
+    assert register.search_functions("TITANIC", search_field="comment")[0]["name"] == "read_titanic"
+    assert register.search_functions("TITANIC", search_field="comment", case_sensitive=True) == []
+
+
+def test_find_functions_by_exact_value_and_prefix():
+    register = make_register()
+    assert [r["name"] for r in register.find_functions("Read_Titanic")] == ["read_titanic"]
+    assert [r["name"] for r in register.find_functions("get_survivor", prefix=True)] == ["get_survivor_age", "get_survivor_fare"]
+    assert len(register.find_functions("data_transformer", search_field="category")) == 2
+
+
+def test_search_text_includes_function_source():
+    register = make_register()
+    assert [r["name"] for r in register.search_text("survival fare")] == ["get_survivor_fare"]
+    assert [r["name"] for r in register.search_text("groupby Age")] == ["get_survivor_age"]
+    assert register.search_text("groupby", include_source=False) == []
+
+
+def test_reregistering_a_function_replaces_its_index_entry():
+    register = make_register()
+
+    @register.register_function("data_reader", comment="Reads a Parquet file")
+    def read_titanic(path):
+        return path
+
+    assert register.search_functions("csv") == []
+    assert [r["name"] for r in register.search_functions("read|get")][0] == "read_titanic"
+
+
+def test_clean_source_is_memoized_until_the_file_changes(tmp_path):
+    import importlib.util
+    from function_source import FunctionSource
+
+    module_path = tmp_path / "registered_module.py"
+    module_path.write_text("import functools\n\n@functools.lru_cache(maxsize=None)\ndef double(x):\n    return x * 2\n")
+    spec = importlib.util.spec_from_file_location("registered_module", str(module_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    func = module.double.__wrapped__
+
+    assert FunctionSource.get_clean_source(func) == "def double(x):\n    return x * 2\n"
+    assert FunctionSource.get_clean_source(func) is FunctionSource.get_clean_source(func)
+
+    module_path.write_text("import functools\n\n@functools.lru_cache(maxsize=None)\ndef double(x):\n    return x + x  # changed\n")
+    assert FunctionSource.get_clean_source(func) == "def double(x):\n    return x + x  # changed\n"
+
+
+def test_registry_index_serves_functions_without_importing_them(tmp_path, monkeypatch):
+    import importlib
+    from pipes import Pipeline
+    from flowpilot import FlowPilot
+
+    project = str(tmp_path / "my_project")
+    (tmp_path / "user_functions.py").write_text(
+        "import os\n"
+        "from flowpilot import FlowPilot\n\n"
+        f"fp = FlowPilot(project_name={project!r})\n\n"
+        "@fp.data_reader(comment=\"Lists a directory\")\n"
+        "def list_directory(path):\n"
+        "    return sorted(os.listdir(path))\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    user_functions = importlib.import_module("user_functions")
+    index_path = user_functions.fp.save_registry()
+    del sys.modules["user_functions"]
+
+    fp = FlowPilot(project_name=project)
+    fp.load_registry(index_path)
+    assert fp.category_register.search_functions("directory")[0]["name"] == "list_directory"
+    assert [r["name"] for r in fp.category_register.search_text("listdir")] == ["list_directory"]
+    assert "list_directory" in fp.category_register.search_text("directory", include_source=False)[0]["name"]
+    assert "user_functions" not in sys.modules
+
+    lazy_function = fp.category_register.functions["data_reader"]["list_directory"]["function"]
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", lazy_function, str(tmp_path))
+    assert "user_functions.py" in pipeline.execute()
+    assert "user_functions" in sys.modules
+
+
+def test_cache_keys_of_registry_functions_follow_the_loaded_code(tmp_path, monkeypatch):
+    import importlib
+    from pipes import Pipeline
+    from flowpilot import FlowPilot
+
+    project = str(tmp_path / "my_project")
+    module_source = (
+        "from flowpilot import FlowPilot\n\n"
+        f"fp = FlowPilot(project_name={project!r})\n\n"
+        "@fp.data_reader(comment=\"Reads a list\")\n"
+        "def read():\n"
+        "    return [0, 1, 2]\n\n"
+        "@fp.data_transformer(comment=\"Bumps the values\")\n"
+        "def bump(data):\n"
+        "    return [x + 1 for x in data]\n"
+    )
+    (tmp_path / "bumped_functions.py").write_text(module_source)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    index_path = importlib.import_module("bumped_functions").fp.save_registry()
+
+    def run():
+        sys.modules.pop("bumped_functions", None)
+        fp = FlowPilot(project_name=project)
+        fp.load_registry(index_path)
+        pipeline = Pipeline(fp, cache=True)
+        for category, name in [("data_reader", "read"), ("data_transformer", "bump")]:
+            pipeline.add_step(category, fp.category_register.get_function(category, name))
+        return pipeline.execute()
+
+    assert run() == [1, 2, 3]
+    (tmp_path / "bumped_functions.py").write_text(module_source.replace("x + 1", "x + 100"))
+    assert run() == [100, 101, 102]
+
+
+def write_module(directory, name, source):
+    path = directory / f"{name}.py"
+    path.write_text(source)
+    return path
+
+
+def test_register_package_in_bulk_with_parallel_imports(tmp_path):
+    package = tmp_path / "team_functions"
+    package.mkdir()
+    write_module(package, "__init__", "")
+    write_module(package, "readers", 'def read_orders(path):\n    """Reads the orders"""\n    return path\n\ndef _helper():\n    pass\n')
+    write_module(package, "cleaning", "from os.path import join\n\ndef drop_nulls(df):\n    return df.dropna()\n")
+    sys.path.insert(0, str(tmp_path))
+    try:
+        register = CategoryRegister(["data_reader", "data_transformer"], namespace="team_a")
+        names = register.register_package(
+            "team_functions", lambda func: "data_reader" if func.__name__.startswith("read") else "data_transformer",
+            max_workers=2,
+        )
+    finally:
+        sys.path.remove(str(tmp_path))
+
+    assert sorted(names) == ["team_a.drop_nulls", "team_a.read_orders"]
+    assert register.get_function("data_reader", "team_a.read_orders").__category__ == "data_reader"
+    assert register.functions["data_reader"]["team_a.read_orders"]["comment"] == "Reads the orders"
+    assert [r["name"] for r in register.find_functions("team_a.drop", prefix=True)] == ["team_a.drop_nulls"]
+
+
+def test_merging_namespaces_keeps_functions_with_the_same_name():
+    team_a = CategoryRegister(["data_reader"], namespace="team_a")
+    team_b = CategoryRegister(["data_reader"], namespace="team_b")
+
+    @team_a.register_function("data_reader", comment="Reads team A's data")
+    def read(path):
+        return "a"
+
+    @team_b.register_function("data_reader", comment="Reads team B's data")
+    def read(path):
+        return "b"
+
+    merged = CategoryRegister(["data_reader"])
+    merged.merge(team_a)
+    merged.merge(team_b)
+    assert merged.get_function("data_reader", "team_a.read")(None) == "a"
+    assert merged.get_function("data_reader", "team_b.read")(None) == "b"
+
+    # A name taken by another function is an error rather than a silent overwrite
+    other = CategoryRegister(["data_reader"], namespace="team_a")
+    other.add_function("data_reader", "team_a.read", None, test_merging_namespaces_keeps_functions_with_the_same_name)
+    try:
+        merged.merge(other)
+        assert False, "Expected a ValueError for a name collision"
+    except ValueError:
+        pass
+
+
+def load_module(path, name):
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(name, str(path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_incremental_export_only_writes_changed_categories(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = write_module(tmp_path, "exported_functions", "import os\n\ndef read(path):\n    return os.path.exists(path)\n\ndef clean(df):\n    return df\n")
+    module = load_module(path, "exported_functions")
+    register = CategoryRegister(["data_reader", "data_transformer"])
+    register.register_function("data_reader", comment="Reads")(module.read)
+    register.register_function("data_transformer", comment="Cleans")(module.clean)
+    output = tmp_path / "export"
+
+    assert register.write_category_to_file("all", str(output), incremental=True) == ["data_reader", "data_transformer"]
+    assert register.write_category_to_file("all", str(output), incremental=True) == []
+    assert "import os" in (output / "data_reader.py").read_text()
+
+    # Lines added above the functions: the edited function is still found in the file
+    path.write_text("import os\n\n\n\ndef read(path):\n    return os.path.isfile(path)\n\ndef clean(df):\n    return df\n")
+    assert register.write_category_to_file("all", str(output), incremental=True) == ["data_reader"]
+    assert "os.path.isfile" in (output / "data_reader.py").read_text()
+
+    (output / "data_transformer.py").write_text("edited by hand")
+    assert register.write_category_to_file("all", str(output), incremental=True) == ["data_transformer"]
+
+    # Exported files follow the umask, like files written with open()
+    umask = os.umask(0o022)
+    os.umask(umask)
+    assert (output / "data_reader.py").stat().st_mode & 0o777 == 0o666 & ~umask
+    assert [path.name for path in output.iterdir() if path.name.endswith(".tmp")] == []
+
+
+def test_watch_exports_edited_functions(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    monkeypatch.chdir(tmp_path)
+    path = write_module(tmp_path, "watched_functions", "def read(path):\n    return path\n")
+    module = load_module(path, "watched_functions")
+    register = CategoryRegister(["data_reader"])
+    register.register_function("data_reader", comment="Reads")(module.read)
+    output = tmp_path / "export"
+    stop_event = threading.Event()
+    exports = []
+
+    def on_export(categories):
+        exports.append(categories)
+        stop_event.set()
+
+    watcher = threading.Thread(target=register.watch, args=(str(output), 0.01, stop_event, on_export))
+    watcher.start()
+    try:
+        deadline = time.time() + 5
+        while not (output / "data_reader.py").exists() and time.time() < deadline:
+            time.sleep(0.01)
+        path.write_text("def read(path):\n    return path.strip()\n")
+        watcher.join(timeout=5)
+    finally:
+        stop_event.set()
+    assert exports == [["data_reader"]]
+    assert "path.strip()" in (output / "data_reader.py").read_text()
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "FlowPilot")))
+
+# pipes has to be imported before flowpilot because of the circular import between them
+from pipes import Pipeline, DAGPipeline
+from flowpilot import FlowPilot
+from distributed import DistributedExecutor
+
+
+def square(x):
+    return x * x
+
+
+def worker_pid(_):
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def kill_worker_once(marker_path):
+    # The first worker running this task dies, the task is then run again on another worker
+    if not os.path.exists(marker_path):
+        open(marker_path, "w").close()
+        os._exit(1)
+    return "recovered"
+
+
+def make_frame(n_rows):
+    import pandas as pd
+    return pd.DataFrame({"value": range(n_rows)})
+
+
+def double(df):
+    return df * 2
+
+
+def test_tasks_run_on_local_workers_and_are_requeued_when_a_worker_dies(tmp_path):
+    executor = DistributedExecutor(heartbeat_interval=0.1, heartbeat_timeout=2.0)
+    try:
+        executor.start_local_workers(3)
+        assert executor.wait_for_workers(3, timeout=10)
+        assert list(executor.map(square, range(10))) == [x * x for x in range(10)]
+        pids = set(executor.map(worker_pid, range(12)))
+        assert os.getpid() not in pids and len(pids) > 1
+        assert executor.submit(kill_worker_once, str(tmp_path / "marker")).result(timeout=10) == "recovered"
+        try:
+            executor.submit(square, "a").result(timeout=10)
+            assert False, "Expected the error of the task"
+        except TypeError:
+            pass
+    finally:
+        executor.shutdown()
+
+
+def test_pipelines_run_on_a_unix_socket_executor(tmp_path):
+    fp = FlowPilot(project_name=str(tmp_path / "my_project"))
+    fp.data_reader(comment="Makes a dataframe")(make_frame)
+    fp.data_transformer(comment="Doubles the values")(double)
+
+    executor = DistributedExecutor(str(tmp_path / "coordinator.sock"), spill_directory=str(tmp_path / "spill"))
+    try:
+        executor.start_local_workers(2)
+        pipeline = Pipeline(fp)
+        pipeline.add_step("data_reader", make_frame, 0)
+        pipeline.add_step("data_transformer", double)
+        results = list(pipeline.map([3, 5], executor=executor))
+        assert [result["value"].tolist() for result in results] == [[0, 2, 4], [0, 2, 4, 6, 8]]
+
+        dag = DAGPipeline(fp, executor=executor)
+        dag.add_step("data_reader", make_frame, 4, step_name="frame")
+        dag.add_step("data_transformer", double, depends_on=["frame"])
+        assert dag.execute()["double"]["value"].tolist() == [0, 2, 4, 6]
+        # Spilled results are removed once loaded by the coordinator
+        assert os.listdir(tmp_path / "spill") == []
+    finally:
+        executor.shutdown()
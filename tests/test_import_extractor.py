@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "FlowPilot")))
+
+from import_extractor import ImportExtractor
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_get_unique_imports_scans_only_source_files(tmp_path):
+    write_file(str(tmp_path / ".gitignore"), "build/\n*.gen.py\n")
+    write_file(str(tmp_path / "module.py"), "import os\nimport pandas as pd\n")
+    write_file(str(tmp_path / "generated.gen.py"), "import generated\n")
+    write_file(str(tmp_path / "build" / "module.py"), "import built\n")
+    write_file(str(tmp_path / ".ipynb_checkpoints" / "module.py"), "import checkpoint\n")
+    write_file(str(tmp_path / "data.csv"), "import csv_content\n")
+    notebook = {"cells": [{"cell_type": "code", "source": ["from json import dumps\n"]}]}
+    write_file(str(tmp_path / "notebook.ipynb"), json.dumps(notebook))
+
+    imports = ImportExtractor().get_unique_imports(str(tmp_path))
+    assert imports == ["from json import dumps", "import os", "import pandas as pd"]
+
+
+def test_get_import_list_reparses_changed_files_only(tmp_path):
+    path = str(tmp_path / "module.py")
+    write_file(path, "import os\n")
+    extractor = ImportExtractor()
+    assert extractor.get_import_list([path]) == [["import os"]]
+
+    write_file(path, "import re\nimport sys\n")
+    assert extractor.get_import_list([path]) == [["import re", "import sys"]]
+    assert ImportExtractor._file_cache[path][1] == ["import re", "import sys"]
+
+
+def test_get_function_imports_keeps_only_used_imports():
+    def uses_os_and_pandas(path):
+        return pd.read_csv(os.path.join(path, "data.csv"))
+
+    source = (
+        "def uses_os_and_pandas(path):\n"
+        "    return pd.read_csv(os.path.join(path, 'data.csv'))\n"
+    )
+    fallback_imports = ["import numpy as np", "import pandas as pd"]
+    imports = ImportExtractor().get_function_imports([uses_os_and_pandas], [source], fallback_imports)
+    assert imports == ["import os", "import pandas as pd"]
+
+
+def test_get_import_list_keeps_one_entry_per_file_in_order(tmp_path):
+    first, second = str(tmp_path / "first.py"), str(tmp_path / "second.py")
+    write_file(first, "import os\n")
+    write_file(second, "import re\n")
+    extractor = ImportExtractor()
+    assert extractor.get_import_list([second]) == [["import re"]]
+    # second.py is cached and first.py is parsed, but the result still follows the input order
+    missing = str(tmp_path / "missing.py")
+    assert extractor.get_import_list([first, missing, second]) == [["import os"], [], ["import re"]]
+
+
+def test_function_imports_resolve_multi_name_and_parenthesized_imports(tmp_path):
+    import importlib.util
+
+    path = str(tmp_path / "multi_imports.py")
+    write_file(path, (
+        "import os, json\n"
+        "from typing import (\n    Callable,\n    Dict,\n)\n\n"
+        "def read(path) -> Dict[str, str]:\n"
+        "    return json.loads(open(os.path.join(path, 'data.json')).read())\n"
+    ))
+    spec = importlib.util.spec_from_file_location("multi_imports", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    source = open(path).read().split("\n\n", 1)[1]
+    imports = ImportExtractor().get_function_imports([module.read], [source])
+    assert imports == ["from typing import Dict", "import json", "import os"]
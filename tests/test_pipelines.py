@@ -0,0 +1,947 @@
+import os
+import sys
+import time
+
+# Put the FlowPilot folder first so that its `pipes` module shadows the standard library one
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "FlowPilot")))
+
+# pipes has to be imported before flowpilot because of the circular import between them
+from pipes import Pipeline, DAGPipeline
+from flowpilot import FlowPilot
+
+
+def make_flow_pilot(tmp_path):
+    return FlowPilot(project_name=str(tmp_path / "my_project"))
+
+
+def test_sequential_pipeline(tmp_path):
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Reads a list")
+    def read(n):
+        return list(range(n))
+
+    @fp.data_transformer(comment="Doubles values")
+    def double(data):
+        return [x * 2 for x in data]
+
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read, 3)
+    pipeline.add_step("data_transformer", double)
+    assert pipeline.execute() == [0, 2, 4]
+
+
+def test_dag_pipeline_runs_independent_steps_concurrently(tmp_path):
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Slow reader")
+    def slow_read(value):
+        time.sleep(0.3)
+        return [value]
+
+    @fp.data_transformer(comment="Joins two inputs")
+    def join(left, right):
+        return left + right
+
+    pipeline = DAGPipeline(fp, max_workers=2)
+    pipeline.add_step("data_reader", slow_read, 1, step_name="left")
+    pipeline.add_step("data_reader", slow_read, 2, step_name="right")
+    pipeline.add_step("data_transformer", join, depends_on=["left", "right"])
+
+    start = time.perf_counter()
+    results = pipeline.execute()
+    assert time.perf_counter() - start < 0.55
+    assert results == {"join": [1, 2]}
+
+
+def test_dag_pipeline_rejects_unknown_dependency(tmp_path):
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_transformer(comment="Identity")
+    def identity(data):
+        return data
+
+    pipeline = DAGPipeline(fp)
+    try:
+        pipeline.add_step("data_transformer", identity, depends_on=["missing"])
+    except ValueError as e:
+        assert "unknown step 'missing'" in str(e)
+    else:
+        raise AssertionError("Expected a ValueError")
+
+
+def test_pipeline_cache_skips_unchanged_steps(tmp_path):
+    fp = make_flow_pilot(tmp_path)
+    calls = []
+
+    @fp.data_reader(comment="Reads a list")
+    def read(n):
+        calls.append(n)
+        return list(range(n))
+
+    pipeline = Pipeline(fp, cache=True)
+    pipeline.add_step("data_reader", read, 3)
+    assert pipeline.execute() == [0, 1, 2]
+    assert pipeline.execute() == [0, 1, 2]
+    assert calls == [3]
+    assert pipeline.cache.hits == 1 and pipeline.cache.misses == 1
+
+    # A fresh cache over the same project directory is served from the disk tier
+    pipeline = Pipeline(fp, cache=True)
+    pipeline.add_step("data_reader", read, 3)
+    assert pipeline.execute() == [0, 1, 2]
+    assert calls == [3]
+
+
+def test_cache_keys_follow_the_running_code_rather_than_the_file(tmp_path, monkeypatch):
+    import importlib
+
+    fp = make_flow_pilot(tmp_path)
+    module_path = tmp_path / "scaled_functions.py"
+    module_path.write_text("def scale(data):\n    return [x * 2 for x in data]\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    old_scale = fp.data_transformer(comment="Scales")(importlib.import_module("scaled_functions").scale)
+
+    @fp.data_reader(comment="Reads a list")
+    def read():
+        return [1, 2]
+
+    def run(scale):
+        pipeline = Pipeline(fp, cache=True)
+        pipeline.add_step("data_reader", read)
+        pipeline.add_step("data_transformer", scale)
+        return pipeline.execute()
+
+    # A process still running the old code after the file was edited
+    module_path.write_text("def scale(data):\n    return [x * 30 for x in data]\n")
+    assert run(old_scale) == [2, 4]
+
+    # A new process must not get the results of the old code
+    del sys.modules["scaled_functions"]
+    new_scale = fp.data_transformer(comment="Scales")(importlib.import_module("scaled_functions").scale)
+    assert run(new_scale) == [30, 60]
+
+
+def test_streaming_pipeline_applies_steps_per_chunk(tmp_path):
+    fp = make_flow_pilot(tmp_path)
+    written = []
+
+    @fp.data_reader(comment="Yields batches")
+    def read_batches(n, batch_size):
+        for start in range(0, n, batch_size):
+            yield list(range(start, min(start + batch_size, n)))
+
+    @fp.data_transformer(comment="Doubles values")
+    def double(batch):
+        return [x * 2 for x in batch]
+
+    @fp.data_transformer(comment="Sums values", combine=sum)
+    def total(batch):
+        return sum(batch)
+
+    @fp.data_writer(comment="Writes batches")
+    def write(batches):
+        for batch in batches:
+            written.append(batch)
+
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read_batches, 5, 2)
+    pipeline.add_step("data_transformer", double)
+    pipeline.add_step("data_transformer", total)
+    assert pipeline.execute(stream=True) == 20
+
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read_batches, 5, 2)
+    pipeline.add_step("data_transformer", double)
+    pipeline.add_step("data_writer", write)
+    pipeline.execute(stream=True)
+    assert written == [[0, 2], [4, 6], [8]]
+
+
+def test_register_function_rejects_unknown_option(tmp_path):
+    fp = make_flow_pilot(tmp_path)
+    try:
+        fp.data_transformer(comment="Unknown option", not_an_option=True)
+    except ValueError as e:
+        assert "not_an_option" in str(e)
+    else:
+        raise AssertionError("Expected a ValueError")
+
+
+def test_run_report_and_hooks(tmp_path):
+    import json
+    import pandas as pd
+
+    fp = make_flow_pilot(tmp_path)
+    events = []
+
+    @fp.data_reader(comment="Builds a dataframe")
+    def build(n):
+        return pd.DataFrame({"value": range(n)})
+
+    @fp.data_transformer(comment="Fails")
+    def fail(df):
+        raise RuntimeError("boom")
+
+    pipeline = Pipeline(fp, trace_memory=True)
+    pipeline.add_hook("before_step", lambda record: events.append(("before", record["name"])))
+    pipeline.add_hook("after_step", lambda record: events.append(("after", record["name"])))
+    pipeline.add_hook("on_error", lambda record, error: events.append(("error", str(error))))
+    pipeline.add_step("data_reader", build, 10)
+    pipeline.add_step("data_transformer", fail)
+
+    try:
+        pipeline.execute()
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("Expected a RuntimeError")
+
+    assert events == [("before", "build"), ("after", "build"), ("before", "fail"), ("error", "boom")]
+    build_record, fail_record = pipeline.last_run_report.steps
+    assert build_record["status"] == "ok" and build_record["output_rows"] == 10
+    assert build_record["output_bytes"] > 0 and build_record["peak_memory"] is not None
+    assert fail_record["status"] == "error" and fail_record["input_rows"] == 10
+
+    steps = json.loads(pipeline.get_pipeline_steps_json(include_timings=True))
+    assert steps[0]["status"] == "ok" and steps[0]["wall_time"] >= 0
+
+
+def test_run_report_measures_each_intermediate_once(tmp_path, monkeypatch):
+    import pandas as pd
+    import pipes
+
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Builds a DataFrame")
+    def build(n):
+        return pd.DataFrame({"value": range(n)})
+
+    @fp.data_transformer(comment="Adds one")
+    def add_one(df):
+        return df + 1
+
+    measured = []
+    data_size = pipes.data_size
+    monkeypatch.setattr(pipes, "data_size", lambda data, *args, **kwargs: measured.append(data) or data_size(data, *args, **kwargs))
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", build, 10)
+    pipeline.add_step("data_transformer", add_one)
+    pipeline.add_step("data_transformer", add_one)
+    pipeline.execute()
+
+    assert len(measured) == 3
+    records = pipeline.last_run_report.steps
+    assert [record["input_rows"] for record in records] == [None, 10, 10]
+    # Bytes are counted column by column, so only with trace_memory=True
+    assert all(record["output_bytes"] is None for record in records)
+    # Measuring the peak resident memory resets it for the whole process, so it is opt-in too
+    assert pipeline.last_run_report.peak_rss is None
+
+
+def test_execute_async_overlaps_io_bound_steps(tmp_path):
+    import asyncio
+
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Async reader")
+    async def fetch(value):
+        await asyncio.sleep(0.2)
+        return [value]
+
+    @fp.data_transformer(comment="Sync transformer")
+    def double(data):
+        return data * 2
+
+    pipelines = []
+    for value in range(5):
+        pipeline = Pipeline(fp)
+        pipeline.add_step("data_reader", fetch, value)
+        pipeline.add_step("data_transformer", double)
+        pipelines.append(pipeline)
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(5)
+        return await asyncio.gather(*(p.execute_async(semaphore=semaphore) for p in pipelines))
+
+    start = time.perf_counter()
+    results = asyncio.run(run_all())
+    assert time.perf_counter() - start < 0.6
+    assert results == [[value, value] for value in range(5)]
+    # Async steps also run, one at a time, with the synchronous execute
+    assert pipelines[0].execute() == [0, 0]
+
+
+def test_dag_execute_async(tmp_path):
+    import asyncio
+
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Async reader")
+    async def fetch(value):
+        await asyncio.sleep(0.2)
+        return [value]
+
+    @fp.data_transformer(comment="Joins two inputs")
+    def join(left, right):
+        return left + right
+
+    pipeline = DAGPipeline(fp)
+    pipeline.add_step("data_reader", fetch, 1, step_name="left")
+    pipeline.add_step("data_reader", fetch, 2, step_name="right")
+    pipeline.add_step("data_transformer", join, depends_on=["left", "right"])
+
+    start = time.perf_counter()
+    assert asyncio.run(pipeline.execute_async(max_concurrency=2)) == {"join": [1, 2]}
+    assert time.perf_counter() - start < 0.35
+
+
+def test_map_runs_the_pipeline_per_input(tmp_path):
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Reads a list")
+    def read(n):
+        time.sleep(0.01 * (n % 3))
+        return list(range(n))
+
+    @fp.data_transformer(comment="Adds a value")
+    def add(data, value=0):
+        return [x + value for x in data]
+
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read, 0)
+    pipeline.add_step("data_transformer", add)
+
+    results = list(pipeline.map(range(6), max_workers=3, chunksize=2, executor="thread"))
+    assert results == [list(range(n)) for n in range(6)]
+
+    unordered = dict(pipeline.map(range(6), ordered=False, executor="thread"))
+    assert unordered == {n: list(range(n)) for n in range(6)}
+
+    runs = [{0: (2,), "add": {"value": 10}}]
+    assert list(pipeline.map(runs, executor="thread")) == [[10, 11]]
+
+    try:
+        pipeline.map(range(6), chunksize=0)
+        assert False, "Expected a ValueError when map is called"
+    except ValueError:
+        pass
+
+    dag = DAGPipeline(fp)
+    dag.add_step("data_reader", read, 0, step_name="left")
+    dag.add_step("data_reader", read, 0, step_name="right")
+    dag.add_step("data_transformer", add, depends_on=["left"], value=1)
+    runs = [{"left": (2,), "right": (n,)} for n in range(3)]
+    assert list(dag.map(runs, executor="thread")) == [{"add": [1, 2], "right": list(range(n))} for n in range(3)]
+
+
+def test_incremental_execution_resumes_after_unchanged_steps(tmp_path):
+    fp = make_flow_pilot(tmp_path)
+    calls = []
+
+    @fp.data_reader(comment="Reads a list")
+    def read(n):
+        calls.append("read")
+        return list(range(n))
+
+    @fp.data_transformer(comment="Adds a value")
+    def add(data, value):
+        calls.append("add")
+        return [x + value for x in data]
+
+    @fp.data_transformer(comment="Sums values")
+    def total(data):
+        calls.append("total")
+        return sum(data)
+
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read, 3)
+    pipeline.add_step("data_transformer", add, 1)
+    pipeline.add_step("data_transformer", total)
+    assert pipeline.execute(incremental=True) == 6
+    assert pipeline.get_dirty_steps() == []
+
+    # Changing the args of the second step only reruns it and the steps after it
+    pipeline.steps[1] = (add, (10,), {})
+    assert pipeline.get_dirty_steps() == [1, 2]
+    calls.clear()
+    assert pipeline.execute(incremental=True) == 33
+    assert calls == ["add", "total"]
+
+
+def test_intermediates_are_written_to_disk_when_evicted_from_memory(tmp_path):
+    from cache import StepCache
+
+    directory = tmp_path / "intermediates"
+    store = StepCache(directory=str(directory), max_memory_bytes=100, write_through=False)
+    store.set("first", list(range(10)))
+    assert list(directory.glob("*.pkl")) == []
+    store.set("second", list(range(30)))
+    assert [path.name for path in directory.glob("*.pkl")] == ["first.pkl"]
+    assert store.get("first") == (True, list(range(10)))
+    assert store.get("second") == (True, list(range(30)))
+
+
+def test_columnar_store_maps_numeric_columns(tmp_path):
+    import numpy as np
+    import pandas as pd
+    from columnar import ColumnarStore
+    from cache import StepCache
+
+    df = pd.DataFrame({"Age": [22.0, 38.0, None], "Sex": ["male", "female", "female"]}, index=[10, 11, 12])
+    store = ColumnarStore(str(tmp_path / "store"))
+    ref = store.write("titanic", df)
+    loaded = ref.load()
+    assert loaded.equals(df)
+
+    values = loaded["Age"].to_numpy()
+    while values is not None and not isinstance(values, np.memmap):
+        values = getattr(values, "base", None)
+    assert values is not None
+
+    # Mapped columns are copy-on-write
+    loaded.loc[10, "Age"] = 0.0
+    assert store.read("titanic").loc[10, "Age"] == 22.0
+
+    cache = StepCache(directory=str(tmp_path / "cache"), columnar=True)
+    cache.set("key", df)
+    hit, cached = cache.get("key")
+    assert hit and cached.equals(df)
+    assert cache.stats()["memory_entries"] == 0 and cache.stats()["disk_bytes"] > 0
+
+
+def test_fused_steps_match_unfused_execution(tmp_path):
+    import pandas as pd
+
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Reads the sample data")
+    def read(path):
+        return pd.read_csv(path)
+
+    @fp.data_transformer(comment="Filters dataset by gender", fuse="filter")
+    def get_gender_only(df, gender=""):
+        return df["Sex"] == gender
+
+    @fp.data_transformer(comment="Adds the family size", fuse="assign")
+    def add_family_size(df):
+        return {"FamilySize": df["SibSp"] + df["Parch"] + 1}
+
+    @fp.data_transformer(comment="Keeps large families", fuse="filter")
+    def large_families(df, size):
+        return df["FamilySize"] >= size
+
+    path = os.path.join(os.path.dirname(__file__), "..", "sample_data", "titanic.csv")
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read, path)
+    pipeline.add_step("data_transformer", get_gender_only, "female")
+    pipeline.add_step("data_transformer", add_family_size)
+    pipeline.add_step("data_transformer", large_families, 4)
+
+    expected = pipeline.execute()
+    fused = pipeline.execute(fuse=True)
+    assert fused.equals(expected) and len(fused) > 0
+    assert [record["name"] for record in pipeline.last_run_report.steps] == [
+        "read", "fused(get_gender_only, add_family_size, large_families)"
+    ]
+
+
+def test_fused_step_keys_include_the_arguments_of_its_steps(tmp_path):
+    import pandas as pd
+    from cache import StepCache
+
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Reads the sample data")
+    def read(path):
+        return pd.read_csv(path)
+
+    @fp.data_transformer(comment="Filters dataset by gender", fuse="filter")
+    def by_sex(df, sex):
+        return df["Sex"] == sex
+
+    @fp.data_transformer(comment="Adds the family size", fuse="assign")
+    def add_family_size(df):
+        return {"FamilySize": df["SibSp"] + df["Parch"] + 1}
+
+    path = os.path.join(os.path.dirname(__file__), "..", "sample_data", "titanic.csv")
+    for options in [{"cache": StepCache()}, {"incremental": True}, {"checkpoint": True}]:
+        cache = options.pop("cache", False)
+        pipeline = Pipeline(fp, cache=cache)
+        pipeline.add_step("data_reader", read, path)
+        pipeline.add_step("data_transformer", by_sex, "male")
+        pipeline.add_step("data_transformer", add_family_size)
+        assert set(pipeline.execute(fuse=True, **options)["Sex"]) == {"male"}
+        pipeline.steps[1] = (by_sex, ("female",), {})
+        assert set(pipeline.execute(fuse=True, **options)["Sex"]) == {"female"}
+        assert pipeline.last_run_report.steps[-1]["status"] == "ok"
+
+
+def test_fused_assign_only_sees_the_rows_kept_by_earlier_filters(tmp_path):
+    import json
+    import pandas as pd
+
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Reads the sample data")
+    def read(path):
+        return pd.read_csv(path)
+
+    @fp.data_transformer(comment="Keeps passengers with a known age", fuse="filter")
+    def has_age(df):
+        return df["Age"].notna()
+
+    @fp.data_transformer(comment="Adds the age as an integer", fuse="assign")
+    def age_int(df):
+        return {"AgeInt": df["Age"].astype(int)}
+
+    @fp.data_transformer(comment="Counts rows")
+    def count(df):
+        return len(df)
+
+    path = os.path.join(os.path.dirname(__file__), "..", "sample_data", "titanic.csv")
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read, path)
+    pipeline.add_step("data_transformer", has_age)
+    pipeline.add_step("data_transformer", age_int)
+    pipeline.add_step("data_transformer", count)
+    assert pipeline.execute(fuse=True) == pipeline.execute() == 714
+
+    # The fused step's record gives the timings of every step it ran
+    steps = json.loads(pipeline.get_pipeline_steps_json(include_timings=True))
+    assert [step["output_rows"] for step in steps] == [891, 714, 714, None]
+    assert all(step["status"] == "ok" for step in steps)
+
+
+def test_fused_steps_without_source_code(tmp_path):
+    import pandas as pd
+
+    fp = make_flow_pilot(tmp_path)
+    namespace = {"pd": pd}
+    # As for functions defined in a REPL, inspect can't find the source of these
+    exec(
+        "def read():\n    return pd.DataFrame({'value': range(10)})\n"
+        "def even(df):\n    return df['value'] % 2 == 0\n"
+        "def doubled(df):\n    return {'doubled': df['value'] * 2}\n",
+        namespace,
+    )
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", fp.data_reader(comment="Reads")(namespace["read"]))
+    pipeline.add_step("data_transformer", fp.data_transformer(comment="Evens", fuse="filter")(namespace["even"]))
+    pipeline.add_step("data_transformer", fp.data_transformer(comment="Doubles", fuse="assign")(namespace["doubled"]))
+    assert pipeline.execute(fuse=True)["doubled"].tolist() == [0, 4, 8, 12, 16]
+
+
+def test_compiled_pipeline_matches_execute(tmp_path):
+    import runpy
+    import statistics
+    import pandas as pd
+
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Reads the sample data")
+    def read(path):
+        return pd.read_csv(path)
+
+    @fp.data_transformer(comment="Filters dataset by gender", fuse="filter")
+    def get_gender_only(df, gender=""):
+        return df["Sex"] == gender
+
+    def combine_counts(partials):
+        return sum(partials)
+
+    @fp.data_transformer(comment="Counts survivors", combine=combine_counts)
+    def count_survivors(df):
+        return int(df["Survived"].sum())
+
+    path = os.path.join(os.path.dirname(__file__), "..", "sample_data", "titanic.csv")
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read, path)
+    pipeline.add_step("data_transformer", get_gender_only, gender="female")
+    pipeline.add_step("data_transformer", count_survivors)
+
+    script = pipeline.compile(str(tmp_path / "pipeline.py"), fallback_imports=["import pandas as pd"])
+    with open(script) as file:
+        source = file.read()
+    assert "flowpilot" not in source.lower().replace("generated by flowpilot", "")
+    assert "@fp" not in source
+    assert runpy.run_path(script)["main"]() == pipeline.execute()
+
+    dag = DAGPipeline(fp)
+    dag.add_step("data_reader", read, path, step_name="titanic")
+    dag.add_step("data_transformer", count_survivors, depends_on=["titanic"])
+    script = dag.compile(str(tmp_path / "dag.py"), fallback_imports=["import pandas as pd"])
+    assert runpy.run_path(script)["main"]() == dag.execute()
+
+    # Builtin and library reducers are referred to by name rather than copied
+    @fp.data_transformer(comment="Counts passengers", combine=sum)
+    def count_passengers(df):
+        return len(df)
+
+    @fp.data_transformer(comment="Averages the fares", combine=statistics.fmean)
+    def average_fare(df):
+        return float(df["Fare"].mean())
+
+    for reducer in [count_passengers, average_fare]:
+        reduced = Pipeline(fp)
+        reduced.add_step("data_reader", read, path)
+        reduced.add_step("data_transformer", reducer)
+        script = reduced.compile(str(tmp_path / "reduced.py"), fallback_imports=["import pandas as pd"])
+        assert runpy.run_path(script)["main"]() == reduced.execute()
+
+    pipeline.add_step("data_transformer", count_survivors, object())
+    try:
+        pipeline.compile(str(tmp_path / "invalid.py"), fallback_imports=[])
+        assert False, "Expected a ValueError for an argument which isn't a literal"
+    except ValueError:
+        pass
+
+
+_AGE_FACTOR = 2
+
+
+def _scale(value):
+    return value * _AGE_FACTOR
+
+
+_double_age = _scale
+
+
+def test_compiled_pipeline_includes_the_helpers_and_constants_of_steps(tmp_path):
+    import runpy
+
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Reads a list of ages")
+    def read(n):
+        return list(range(n))
+
+    @fp.data_transformer(comment="Scales the ages")
+    def scale_all(ages):
+        return [_scale(age) + _double_age(age) for age in ages]
+
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read, 4)
+    pipeline.add_step("data_transformer", scale_all)
+    script = pipeline.compile(str(tmp_path / "pipeline.py"), fallback_imports=[])
+    with open(script) as file:
+        source = file.read()
+    assert "_AGE_FACTOR = 2" in source and "_double_age = _scale" in source
+    assert runpy.run_path(script)["main"]() == pipeline.execute() == [0, 4, 8, 12]
+
+    # Values which can't be written to the script fail the compilation rather than the script
+    threshold = object()
+
+    @fp.data_transformer(comment="Compares to a threshold")
+    def is_threshold(ages):
+        return ages is threshold
+
+    pipeline.add_step("data_transformer", is_threshold)
+    try:
+        pipeline.compile(str(tmp_path / "invalid.py"), fallback_imports=[])
+        assert False, "Expected a ValueError for a global which can't be written to a script"
+    except ValueError:
+        pass
+
+
+def test_dag_memory_budget_spills_and_releases(tmp_path):
+    import pandas as pd
+
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Makes a dataframe")
+    def make_frame(n_rows):
+        return pd.DataFrame({"value": range(n_rows)})
+
+    @fp.data_transformer(comment="Doubles the values")
+    def double(df):
+        return df * 2
+
+    @fp.data_transformer(comment="Adds two dataframes")
+    def add(left, right):
+        return left + right
+
+    def build(memory_budget):
+        pipeline = DAGPipeline(fp, memory_budget=memory_budget)
+        pipeline.add_step("data_reader", make_frame, 100000, step_name="left")
+        pipeline.add_step("data_reader", make_frame, 100000, step_name="right")
+        pipeline.add_step("data_transformer", double, step_name="double_left", depends_on=["left"])
+        pipeline.add_step("data_transformer", add, depends_on=["double_left", "right"])
+        return pipeline
+
+    expected = build(None).execute()["add"]
+    pipeline = build(1000)
+    assert pipeline.execute()["add"].equals(expected)
+    report = pipeline.last_run_report.to_dict()
+    assert report["spilled"] and report["peak_rss"] > 0
+    # The spilled outputs are removed with the run
+    assert not os.listdir(fp.project.get_internal_directory("spill"))
+
+
+def family_features(df):
+    return df.assign(FamilySize=df["SibSp"] + df["Parch"] + 1, Worker=os.getpid())
+
+
+def count_rows(df):
+    return len(df)
+
+
+def test_partitioned_step_runs_across_processes_in_order(tmp_path):
+    import pandas as pd
+
+    fp = make_flow_pilot(tmp_path)
+
+    @fp.data_reader(comment="Reads the sample data")
+    def read(path):
+        return pd.read_csv(path)
+
+    fp.data_transformer(comment="Adds the family size", partitions=4)(family_features)
+    fp.data_transformer(comment="Counts the rows", partitions=3, combine=sum)(count_rows)
+
+    path = os.path.join(os.path.dirname(__file__), "..", "sample_data", "titanic.csv")
+    pipeline = Pipeline(fp, partition_workers=2)
+    pipeline.add_step("data_reader", read, path)
+    pipeline.add_step("data_transformer", family_features)
+    result = pipeline.execute()
+
+    expected = pd.read_csv(path)
+    assert result.drop(columns="Worker").equals(expected.assign(FamilySize=expected["SibSp"] + expected["Parch"] + 1))
+    assert os.getpid() not in set(result["Worker"])
+
+    pipeline.add_step("data_transformer", count_rows)
+    assert pipeline.execute() == len(expected)
+
+
+def test_retries_and_timeouts(tmp_path):
+    fp = make_flow_pilot(tmp_path)
+    attempts = []
+
+    @fp.data_reader(comment="Fails twice before reading", retries=2, retry_delay=0.01)
+    def flaky_read():
+        attempts.append(time.perf_counter())
+        if len(attempts) < 3:
+            raise ConnectionError("transient")
+        return [1, 2]
+
+    @fp.data_transformer(comment="Hangs", timeout=0.05)
+    def hang(data):
+        time.sleep(0.5)
+        return data
+
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", flaky_read)
+    assert pipeline.execute() == [1, 2]
+    assert len(attempts) == 3 and attempts[2] - attempts[1] >= 0.02
+    assert pipeline.last_run_report.steps[0]["retries"] == 2
+
+    pipeline.add_step("data_transformer", hang)
+    start = time.perf_counter()
+    try:
+        pipeline.execute()
+        assert False, "Expected the step to time out"
+    except TimeoutError:
+        assert time.perf_counter() - start < 0.4
+
+    # The options also apply to async steps, and to the runs of map
+    import asyncio
+
+    @fp.data_reader(comment="Fails once before fetching", retries=1, retry_delay=0.01)
+    async def flaky_fetch():
+        attempts.append(time.perf_counter())
+        if len(attempts) % 2:
+            raise ConnectionError("transient")
+        return [3]
+
+    @fp.data_reader(comment="Hangs", timeout=0.05)
+    async def hang_fetch():
+        await asyncio.sleep(0.5)
+
+    attempts.clear()
+    async_pipeline = Pipeline(fp)
+    async_pipeline.add_step("data_reader", flaky_fetch)
+    assert asyncio.run(async_pipeline.execute_async()) == [3]
+    assert async_pipeline.last_run_report.steps[0]["retries"] == 1
+    async_pipeline.steps[0] = (hang_fetch, (), {})
+    try:
+        asyncio.run(async_pipeline.execute_async())
+        assert False, "Expected the step to time out"
+    except TimeoutError:
+        pass
+
+    attempts.clear()
+    mapped = Pipeline(fp)
+    mapped.add_step("data_reader", flaky_read)
+    assert list(mapped.map([(), ()], executor="thread")) == [[1, 2], [1, 2]]
+    # The first two attempts failed
+    assert len(attempts) == 4
+
+
+def test_checkpointed_run_resumes_after_a_failure(tmp_path):
+    fp = make_flow_pilot(tmp_path)
+    calls = []
+    fail = [True]
+
+    @fp.data_reader(comment="Reads a list")
+    def read(n):
+        calls.append("read")
+        return list(range(n))
+
+    @fp.data_transformer(comment="Fails on the first run")
+    def fragile(data):
+        calls.append("fragile")
+        if fail[0]:
+            raise RuntimeError("killed")
+        return [x * 2 for x in data]
+
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read, 3)
+    pipeline.add_step("data_transformer", fragile)
+    try:
+        pipeline.execute(checkpoint=True)
+    except RuntimeError:
+        pass
+
+    fail[0] = False
+    # A new pipeline object, as after a restart of the process
+    resumed = Pipeline(fp)
+    resumed.steps = pipeline.steps
+    assert resumed.execute(checkpoint=True) == [0, 2, 4]
+    assert calls == ["read", "fragile", "fragile"]
+
+    # Completed runs remove their checkpoints
+    assert resumed.execute(checkpoint=True) == [0, 2, 4]
+    assert calls[-2:] == ["read", "fragile"]
+
+
+def test_columns_and_filters_are_pushed_down_to_the_reader(tmp_path):
+    import pandas as pd
+
+    fp = make_flow_pilot(tmp_path)
+    reads = []
+
+    @fp.data_reader(comment="Reads only the columns and rows the pipeline uses", pushdown=True)
+    def read(path, columns=None, predicate=None):
+        reads.append(columns)
+        chunks = pd.read_csv(path, usecols=columns, chunksize=200)
+        return pd.concat(chunk[predicate(chunk)] if predicate else chunk for chunk in chunks)
+
+    @fp.data_transformer(comment="Filters dataset by gender", fuse="filter", columns=["Sex"])
+    def get_gender_only(df, gender=""):
+        return df["Sex"] == gender
+
+    @fp.data_transformer(comment="Counts survivors", columns=["Survived"], combine=sum)
+    def count_survivors(df):
+        return int(df["Survived"].sum())
+
+    path = os.path.join(os.path.dirname(__file__), "..", "sample_data", "titanic.csv")
+    pipeline = Pipeline(fp)
+    pipeline.add_step("data_reader", read, path)
+    pipeline.add_step("data_transformer", get_gender_only, "female")
+    pipeline.add_step("data_transformer", count_survivors)
+
+    titanic = pd.read_csv(path)
+    females = titanic[titanic["Sex"] == "female"]
+    assert pipeline.execute() == females["Survived"].sum()
+    assert reads == [["Sex", "Survived"]]
+    assert [record["name"] for record in pipeline.last_run_report.steps] == ["read", "count_survivors"]
+
+    # A step which doesn't declare its columns disables the projection, but not the filters before it
+    @fp.data_transformer(comment="Counts rows")
+    def count(df):
+        return len(df)
+
+    pipeline.steps[-1] = (count, (), {})
+    assert pipeline.execute() == (titanic["Sex"] == "female").sum()
+    assert reads[-1] is None
+
+    # When the frame itself is the output, every column is read
+    pipeline.steps.pop()
+    assert pipeline.execute().equals(titanic[titanic["Sex"] == "female"])
+    assert reads[-1] is None
+
+    # Columns added by an assign step are not in the file, so they can't be projected
+    @fp.data_transformer(comment="Adds the family size", fuse="assign", columns=["SibSp", "Parch"])
+    def add_family_size(df):
+        return {"FamilySize": df["SibSp"] + df["Parch"] + 1}
+
+    @fp.data_transformer(comment="Sums the family sizes", columns=["FamilySize"], combine=sum)
+    def total_family_size(df):
+        return int(df["FamilySize"].sum())
+
+    pipeline.add_step("data_transformer", add_family_size)
+    pipeline.add_step("data_transformer", total_family_size)
+    assert pipeline.execute() == (females["SibSp"] + females["Parch"] + 1).sum()
+    assert reads[-1] is None
+
+    # Other steps may return the rows of their input, so the output of a step which isn't a reducer or a writer
+    # can carry every column of the reader
+    @fp.data_transformer(comment="Keeps the rows of a gender", columns=["Sex"])
+    def get_gender_rows(df, gender):
+        return df[df["Sex"] == gender]
+
+    @fp.data_transformer(comment="Sorts by age", columns=["Age"])
+    def sort_by_age(df):
+        return df.sort_values("Age")
+
+    pipeline.steps[1:] = [(get_gender_rows, ("female",), {})]
+    assert list(pipeline.execute().columns) == list(titanic.columns)
+    pipeline.add_step("data_transformer", sort_by_age)
+    assert list(pipeline.execute().columns) == list(titanic.columns)
+    assert reads[-2:] == [None, None]
+
+
+def test_pipeline_group_runs_shared_prefixes_once_and_releases_them(tmp_path):
+    import weakref
+    from pipes import PipelineGroup
+
+    fp = make_flow_pilot(tmp_path)
+    calls = []
+    outputs = {}
+
+    class Values(list):
+        pass
+
+    @fp.data_reader(comment="Reads a list")
+    def read(n):
+        calls.append(("read", n))
+        result = Values(range(n))
+        outputs["read"] = weakref.ref(result)
+        return result
+
+    @fp.data_transformer(comment="Adds a value")
+    def add(data, value):
+        calls.append(("add", value))
+        return Values(x + value for x in data)
+
+    @fp.data_transformer(comment="Sums the values")
+    def total(data):
+        # By then, every branch has consumed the output of the reader
+        calls.append(("total", outputs["read"]() is None))
+        return sum(data)
+
+    def build(*steps):
+        pipeline = Pipeline(fp)
+        pipeline.add_step("data_reader", read, 3)
+        for value in steps:
+            pipeline.add_step("data_transformer", add, value)
+        return pipeline
+
+    first, second, third = build(1), build(1, 10), build(2)
+    third.add_step("data_transformer", total)
+    group = PipelineGroup(fp, [first, second, third])
+
+    assert group.get_step_counts() == {"steps": 8, "executed_steps": 5}
+    assert group.execute() == [[1, 2, 3], [11, 12, 13], 9]
+    assert calls == [("read", 3), ("add", 1), ("add", 10), ("add", 2), ("total", True)]
+    assert len(group.last_run_report.steps) == 5
+
+    # A pipeline ending at a shared step gets its output, which is then kept
+    assert PipelineGroup(fp, [build(), build(1)]).execute() == [[0, 1, 2], [1, 2, 3]]
+
+    dag = DAGPipeline(fp)
+    dag.add_step("data_reader", read, 3)
+    try:
+        PipelineGroup(fp, [build(), dag])
+        assert False, "Expected a ValueError for a DAGPipeline"
+    except ValueError:
+        pass
@@ -0,0 +1,76 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "FlowPilot")))
+
+# pipes has to be imported before flowpilot because of the circular import between them
+import pipes
+from flowpilot import FlowPilot
+
+
+def double_values(data):
+    return [x * 2 for x in data]
+
+
+def check_double_values():
+    assert double_values([1, 2]) == [2, 4]
+
+
+def check_failing():
+    assert double_values([1]) == [3]
+
+
+def test_run_tests_in_processes_and_skip_unchanged_passing_tests(tmp_path, capsys):
+    fp = FlowPilot(project_name=str(tmp_path / "my_project"))
+    fp.data_transformer(comment="Doubles values")(double_values)
+    fp.test(comment="Checks double_values")(check_double_values)
+    fp.test(comment="Always fails")(check_failing)
+
+    results = {result["name"]: result for result in fp.run_tests(max_workers=2)}
+    assert results["check_double_values"]["status"] == "passed"
+    assert results["check_double_values"]["wall_time"] >= 0
+    assert results["check_failing"]["status"] == "failed"
+    assert "AssertionError" in results["check_failing"]["error"]
+    assert "1 passed, 1 failed, 0 skipped" in capsys.readouterr().out
+
+    statuses = {result["name"]: result["status"] for result in fp.run_tests(executor="thread")}
+    assert statuses == {"check_double_values": "skipped", "check_failing": "failed"}
+    assert [result["name"] for result in fp.run_tests("double", executor="thread", force=True)] == ["check_double_values"]
+
+
+def test_changing_a_referenced_function_reruns_the_test(tmp_path):
+    fp = FlowPilot(project_name=str(tmp_path / "my_project"))
+
+    @fp.data_transformer(comment="Adds one")
+    def add_one(data):
+        return [x + 1 for x in data]
+
+    @fp.test(comment="Checks add_one")
+    def check_add_one():
+        assert add_one([1]) == [2]
+
+    assert fp.run_tests(executor="thread")[0]["status"] == "passed"
+    assert fp.run_tests(executor="thread")[0]["status"] == "skipped"
+
+    @fp.data_transformer(comment="Adds one")
+    def add_one(data):
+        return [x + 1 for x in list(data)]
+
+    assert fp.run_tests(executor="thread")[0]["status"] == "passed"
+
+
+def test_a_test_which_cant_be_sent_to_a_worker_fails_alone(tmp_path):
+    fp = FlowPilot(project_name=str(tmp_path / "my_project"))
+    fp.data_transformer(comment="Doubles values")(double_values)
+    fp.test(comment="Checks double_values")(check_double_values)
+
+    @fp.test(comment="Defined in a function, so it can't be pickled")
+    def check_local():
+        pass
+
+    results = {result["name"]: result for result in fp.run_tests(max_workers=2)}
+    assert results["check_double_values"]["status"] == "passed"
+    assert results["check_local"]["status"] == "failed"
+    assert "pickle" in results["check_local"]["error"]
+    # The state of the tests which ran is still saved
+    assert fp.run_tests("check_double", max_workers=2)[0]["status"] == "skipped"